@@ -72,6 +72,12 @@ def webhook_guide():
 def health():
     return {"status": "healthy", "service": "generation-service"}, 200
 
+# In-process cache counters
+@app.route('/metrics')
+def metrics():
+    from services.openai_client import llm_cache_stats
+    return {"caches": llm_cache_stats()}, 200
+
 # Start background worker
 def start_background_services():
     """Start background services for production"""
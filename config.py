@@ -25,6 +25,12 @@ MAX_FILE_BYTES = 200_000_000  # 200 MB
 MAX_LINES = 50_000
 MAX_SYNC_IMAGES = 20
 MAX_IMAGE_SIZE = 10_000_000  # 10 MB
+VISION_CONTEXT_TOKENS = int(os.getenv("VISION_CONTEXT_TOKENS", "200000"))  # o4-mini context window
+TRANSLATION_CONCURRENCY = int(os.getenv("TRANSLATION_CONCURRENCY", "16"))  # Max in-flight async translation requests
+TRANSLATION_CACHE_SIZE = int(os.getenv("TRANSLATION_CACHE_SIZE", "4096"))
+TRANSLATION_CACHE_TTL = int(os.getenv("TRANSLATION_CACHE_TTL", "86400"))  # Seconds to reuse an identical translation
+VISION_CACHE_SIZE = int(os.getenv("VISION_CACHE_SIZE", "1024"))
+VISION_CACHE_TTL = int(os.getenv("VISION_CACHE_TTL", "3600"))  # Seconds to reuse a description for the same images
 
 # Translation configuration
 SYNC_TRANSLATION_WARNING_THRESHOLD = int(
@@ -38,12 +44,25 @@ ACTIVE_BATCH_LIMIT_GLB = int(os.getenv("ACTIVE_BATCH_LIMIT_GLB", "10"))
 # Retry Configuration
 RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", "5"))
 BASE_DELAY_SEC = int(os.getenv("BASE_DELAY_SEC", "2"))
+MAX_DELAY_SEC = int(os.getenv("MAX_DELAY_SEC", "60"))  # Ceiling for a single backoff sleep
 
 # Image Validation Timeouts
 IMAGE_HEAD_TIMEOUT = int(os.getenv("IMAGE_HEAD_TIMEOUT", "3"))
 IMAGE_GET_TIMEOUT = int(os.getenv("IMAGE_GET_TIMEOUT", "5"))
 IMAGE_GET_MAX_SIZE = int(os.getenv("IMAGE_GET_MAX_SIZE", "32768"))  # 32 KB for fallback GET
+IMAGE_VALIDATION_WORKERS = int(os.getenv("IMAGE_VALIDATION_WORKERS", "16"))
+IMAGE_CHECK_CACHE_TTL = int(os.getenv("IMAGE_CHECK_CACHE_TTL", "300"))  # Seconds to trust a successful check
+IMAGE_REVALIDATE_TTL = int(os.getenv("IMAGE_REVALIDATE_TTL", "86400"))  # Seconds to keep ETag/Last-Modified for conditional checks
 
 # Webhook Configuration
 WEBHOOK_RETRY_ATTEMPTS = int(os.getenv("WEBHOOK_RETRY_ATTEMPTS", "5"))
 WEBHOOK_BASE_DELAY = int(os.getenv("WEBHOOK_BASE_DELAY", "1"))
+WEBHOOK_RETRY_BACKOFF = (30, 60, 120, 240, 300)  # Seconds before a stored delivery is retried, indexed by attempts already made
+WEBHOOK_MAX_ATTEMPTS = len(WEBHOOK_RETRY_BACKOFF)  # Stored delivery attempts before it stays failed
+WEBHOOK_GZIP_THRESHOLD = int(os.getenv("WEBHOOK_GZIP_THRESHOLD", "0"))  # Gzip bodies larger than this many bytes; 0 disables (receivers must accept Content-Encoding: gzip)
+WEBHOOK_SEND_CONCURRENCY = int(os.getenv("WEBHOOK_SEND_CONCURRENCY", "32"))  # Max connections sending WebhookHandler webhooks
+WEBHOOK_DELIVERY_CONCURRENCY = int(os.getenv("WEBHOOK_DELIVERY_CONCURRENCY", "200"))  # Max connections posting pending WebhookSender deliveries
+WEBHOOK_HOST_CONCURRENCY = int(os.getenv("WEBHOOK_HOST_CONCURRENCY", "10"))  # Deliveries posted to one host at once; the breaker is checked between waves
+WEBHOOK_BREAKER_THRESHOLD = int(os.getenv("WEBHOOK_BREAKER_THRESHOLD", "5"))  # Consecutive failures before a host's deliveries are paused
+WEBHOOK_BREAKER_COOLDOWN = int(os.getenv("WEBHOOK_BREAKER_COOLDOWN", "60"))  # Seconds to pause deliveries to a failing host
+WEBHOOK_METRICS_CACHE_TTL = int(os.getenv("WEBHOOK_METRICS_CACHE_TTL", "30"))  # Seconds to reuse webhook monitoring aggregates
@@ -1,7 +1,7 @@
 import uuid
 from datetime import datetime
 from typing import Dict, Any
-from sqlalchemy import Column, String, Text, Integer, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, String, Text, Integer, DateTime, ForeignKey, JSON, Index, text, func
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from flask_sqlalchemy import SQLAlchemy
@@ -11,11 +11,27 @@ db = SQLAlchemy()
 
 class BatchJob(db.Model):
     __tablename__ = 'batch_jobs'
+    __table_args__ = (
+        # Monitor polling (get_active_batch_jobs) only ever looks at these statuses
+        Index(
+            'ix_batchjob_active', 'status',
+            postgresql_where=text("status IN ('pending', 'processing', 'failed')")
+        ),
+        # cleanup_old_jobs filters on status + updated_at cutoff
+        Index('ix_batchjob_cleanup', 'status', 'updated_at'),
+        # Orphaned-job scan in tools/recover_lost_batches.py
+        Index(
+            'ix_batchjob_orphaned', 'created_at',
+            postgresql_where=text(
+                "openai_batch_id IS NULL AND status IN ('processing', 'translating', 'failed')"
+            )
+        ),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     status = Column(String(20), nullable=False, default='pending')
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
     
     # OpenAI integration
     openai_batch_id = Column(String(100), nullable=True, index=True)
@@ -56,6 +72,10 @@ class BatchJob(db.Model):
 
 class BatchLot(db.Model):
     __tablename__ = 'batch_lots'
+    __table_args__ = (
+        # Per-lot lookups in save_batch_results
+        Index('ix_batchlot_job_lot', 'batch_job_id', 'lot_id'),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     batch_job_id = Column(UUID(as_uuid=True), ForeignKey('batch_jobs.id'), nullable=False)
@@ -78,7 +98,7 @@ class BatchLot(db.Model):
     
     # Timestamps
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
     
     # Relationships
     batch_job = relationship("BatchJob", back_populates="lots")
@@ -123,6 +143,14 @@ class BatchResult(db.Model):
 
 class WebhookDelivery(db.Model):
     __tablename__ = 'webhook_deliveries'
+    __table_args__ = (
+        # get_pending_webhook_deliveries filters on all three columns
+        Index('ix_webhook_pending', 'status', 'attempt_count', 'next_attempt_at'),
+        # WebhookMonitor metrics: created_at window plus status/attempt_count
+        Index('ix_webhook_metrics', 'created_at', 'status', 'attempt_count'),
+        # Per-endpoint health grouping
+        Index('ix_webhook_url', 'webhook_url'),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     batch_job_id = Column(UUID(as_uuid=True), ForeignKey('batch_jobs.id'), nullable=False)
@@ -0,0 +1,27 @@
+-- Migration: Add indexes for monitor polling, webhook retries and cleanup
+-- Version: 002
+-- Date: 2026-10-16
+-- Description: Composite/partial indexes matching the predicates used by
+--              get_active_batch_jobs, get_pending_webhook_deliveries,
+--              cleanup_old_jobs and save_batch_results
+--
+-- Run with autocommit (e.g. psql without --single-transaction): CREATE INDEX
+-- CONCURRENTLY cannot run inside a transaction block, so runners that wrap the
+-- file in BEGIN/COMMIT must apply it statement by statement
+
+-- Active jobs polled by the batch monitor
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_batchjob_active
+    ON batch_jobs(status)
+    WHERE status IN ('pending', 'processing', 'failed');
+
+-- Old completed/failed jobs removed by cleanup
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_batchjob_cleanup
+    ON batch_jobs(status, updated_at);
+
+-- Lot lookups by (job, lot_id) when saving results
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_batchlot_job_lot
+    ON batch_lots(batch_job_id, lot_id);
+
+-- Webhook deliveries waiting for a retry
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_webhook_pending
+    ON webhook_deliveries(status, attempt_count, next_attempt_at);
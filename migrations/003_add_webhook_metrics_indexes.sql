@@ -0,0 +1,17 @@
+-- Migration: Add indexes for webhook monitoring queries
+-- Version: 003
+-- Date: 2026-10-16
+-- Description: Composite index for the time-windowed delivery metrics and an
+--              index on webhook_url for per-endpoint health grouping
+--
+-- Run with autocommit (e.g. psql without --single-transaction): CREATE INDEX
+-- CONCURRENTLY cannot run inside a transaction block, so runners that wrap the
+-- file in BEGIN/COMMIT must apply it statement by statement
+
+-- Delivery metrics over a created_at window, split by status/attempt_count
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_webhook_metrics
+    ON webhook_deliveries(created_at, status, attempt_count);
+
+-- Endpoint health grouped by webhook_url
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_webhook_url
+    ON webhook_deliveries(webhook_url);
@@ -0,0 +1,15 @@
+-- Migration: Add partial index for the orphaned-job scan
+-- Version: 004
+-- Date: 2026-10-16
+-- Description: Partial index matching the predicate used by
+--              tools/recover_lost_batches.py (jobs without an OpenAI batch id)
+--
+-- Run with autocommit (e.g. psql without --single-transaction): CREATE INDEX
+-- CONCURRENTLY cannot run inside a transaction block, so runners that wrap the
+-- file in BEGIN/COMMIT must apply it statement by statement
+
+-- Orphaned jobs, newest first (a B-tree on created_at is scanned backwards for DESC)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_batchjob_orphaned
+    ON batch_jobs(created_at)
+    WHERE openai_batch_id IS NULL
+      AND status IN ('processing', 'translating', 'failed');
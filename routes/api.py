@@ -120,39 +120,24 @@ def handle_sync_request(lot, languages):
                 f"processing {len(non_english_languages)} languages may increase response time"
             )
 
-        # Generate translations with timeout protection
-        translation_start = time.time()
+        # Generate translations concurrently with timeout protection
         max_translation_time = 45  # Maximum 45 seconds for all translations
-        pending_languages = []
-
-        for idx, lang in enumerate(non_english_languages):
-            # Check if we're running out of time
-            elapsed = time.time() - translation_start
-            if elapsed > max_translation_time:
-                logger.warning(
-                    "Translation timeout reached, using English fallback for remaining languages"
-                )
-                pending_languages = non_english_languages[idx:]
-                for remaining_lang in pending_languages:
-                    descriptions.append({
-                        "language": remaining_lang,
-                        "damages": f"<p>{english_description}</p>"
-                    })
-                warnings.append("translation_time_limit_exceeded")
-                break
+        translations = openai_client.translate_languages(
+            english_description, non_english_languages, timeout=max_translation_time
+        )
+        pending_languages = [lang for lang in non_english_languages if lang not in translations]
+        if pending_languages:
+            logger.warning(
+                "Translation timeout reached, using English fallback for remaining languages"
+            )
+            warnings.append("translation_time_limit_exceeded")
 
-            try:
-                translated_text = openai_client.translate_text(english_description, lang)
-                descriptions.append({
-                    "language": lang,
-                    "damages": f"<p>{translated_text}</p>"
-                })
-            except Exception as e:
-                logger.error(f"Translation failed for {lang}: {str(e)}")
-                descriptions.append({
-                    "language": lang,
-                    "damages": f"<p>{english_description}</p>"
-                })
+        for lang in non_english_languages:
+            translated_text = translations.get(lang, english_description)
+            descriptions.append({
+                "language": lang,
+                "damages": f"<p>{translated_text}</p>"
+            })
         
         # Prepare response
         response = {
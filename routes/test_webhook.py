@@ -4,7 +4,7 @@ Test webhook endpoint integrated into main application
 
 from flask import Blueprint, request, jsonify
 import logging
-import json
+import orjson
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -29,7 +29,7 @@ def test_webhook_receiver():
         
         # Get body
         body = request.get_data(as_text=True)
-        data = json.loads(body) if body else {}
+        data = orjson.loads(body) if body else {}
         
         # Log receipt
         logger.info(f"TEST WEBHOOK RECEIVED at {datetime.utcnow().isoformat()}")
@@ -85,10 +85,15 @@ def get_webhook_failures():
 def get_webhook_endpoints():
     """
     Get health metrics per webhook endpoint
+    Query parameters:
+    - limit: Maximum number of endpoints to return, worst first (default: all)
+    - min_attempts: Skip endpoints with fewer deliveries (default: 0)
     """
     try:
+        limit = request.args.get('limit', None, type=int)
+        min_attempts = request.args.get('min_attempts', 0, type=int)
         monitor = WebhookMonitor(db.session)
-        endpoints = monitor.get_webhook_endpoint_health()
+        endpoints = monitor.get_webhook_endpoint_health(limit=limit, min_attempts=min_attempts)
         
         return jsonify({
             'success': True,
@@ -2,8 +2,8 @@ import logging
 import time
 import threading
 from typing import Dict, Any
-from datetime import datetime, timedelta
 from flask import current_app
+from config import WEBHOOK_MAX_ATTEMPTS
 from services.database_manager import DatabaseManager
 from services.batch_monitor import BatchMonitor
 from services.webhook_sender import WebhookSender
@@ -24,7 +24,7 @@ class BackgroundWorker:
         
         # Configuration
         self.check_interval = 30  # Check every 30 seconds
-        self.max_webhook_retries = 5
+        self.max_webhook_retries = WEBHOOK_MAX_ATTEMPTS
         
         # Services will be initialized when worker starts
         self.db_manager = None
@@ -140,25 +140,20 @@ class BackgroundWorker:
                 try:
                     # Check retry limit
                     if webhook.attempt_count >= self.max_webhook_retries:
-                        db_manager.mark_webhook_failed(str(webhook.id), "Max retries exceeded")
+                        db_manager.finalize_webhook(str(webhook.id), 'failed', error_message="Max retries exceeded")
                         continue
                     
                     # Attempt delivery
                     success = webhook_sender.deliver_webhook(webhook)
                     
                     if success:
-                        db_manager.mark_webhook_delivered(str(webhook.id))
+                        db_manager.finalize_webhook(str(webhook.id), 'delivered')
                         logger.info(f"Webhook delivered successfully to {webhook.webhook_url}")
                     else:
                         # Schedule retry
-                        retry_delay = min(300, 30 * (2 ** min(int(webhook.attempt_count), 10)))  # Exponential backoff, max 5 minutes
-                        next_attempt = datetime.utcnow() + timedelta(seconds=retry_delay)
-                        
-                        db_manager.update_webhook_attempt(
-                            str(webhook.id), 
-                            int(webhook.attempt_count) + 1,
-                            next_attempt,
-                            "Delivery failed, will retry"
+                        db_manager.finalize_webhook(
+                            str(webhook.id), 'retry',
+                            error_message="Delivery failed, will retry"
                         )
                         
                 except Exception as e:
@@ -1,8 +1,9 @@
 import logging
 import time
 import threading
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterable, Optional
 from datetime import datetime, timedelta
+from sqlalchemy import func, update
 from services.openai_client import OpenAIClient
 from services.database_manager import DatabaseManager
 from services.webhook_sender import WebhookSender
@@ -10,6 +11,24 @@ from database.models import db, BatchLot
 
 logger = logging.getLogger(__name__)
 
+def response_output_text(body: Any) -> str:
+    """
+    Text of the first message in a batch result body, or '' if there is none
+    
+    Direct indexing on the Responses API shape (output[i] with type "message"),
+    falling back to the chat completions shape (choices[0].message.content)
+    """
+    try:
+        for item in body['output']:
+            if item['type'] == 'message':
+                return item['content'][0]['text'] or ''
+    except (KeyError, IndexError, TypeError):
+        pass
+    try:
+        return body['choices'][0]['message']['content'] or ''
+    except (KeyError, IndexError, TypeError):
+        return ''
+
 class BatchMonitor:
     def __init__(self, interval: int = 30):
         self.interval = interval
@@ -133,17 +152,11 @@ class BatchMonitor:
     def _process_vision_results(self, job, batch_status: Dict[str, Any]):
         """Process completed vision batch results"""
         try:
-            # Download results from OpenAI
-            results_content = self.openai_client.download_batch_results(
-                batch_status['output_file_id']
+            # Stream vision results from OpenAI straight into the database, one record at a time
+            self._save_vision_results(
+                job, self.openai_client.iter_batch_results(batch_status['output_file_id'])
             )
             
-            # Parse and save vision results
-            vision_results = self._parse_batch_results(results_content)
-            
-            # Update database with vision results
-            self._save_vision_results(job, vision_results)
-            
             # If no translations needed, complete the job
             if not job.languages or job.languages == ['en']:
                 self._finalize_job_results(job)
@@ -154,10 +167,8 @@ class BatchMonitor:
                 self.db_manager.update_batch_job_status(str(job.id), 'processing', None)
                 logger.info(f"Starting translation batch for job {job.id} with languages {job.languages}")
                 
-                # Start translation batch
-                # Convert parsed results to expected format
-                vision_results_dict = {'results': vision_results}
-                self._start_translation_batch(job, vision_results_dict)
+                # Start translation batch (it reads the saved vision results back from the database)
+                self._start_translation_batch(job)
                 
         except Exception as e:
             logger.error(f"Error processing vision results for job {job.id}: {str(e)}")
@@ -166,15 +177,11 @@ class BatchMonitor:
     def _process_translation_results(self, job, batch_status: Dict[str, Any]):
         """Process completed translation batch results"""
         try:
-            # Download translation results
-            results_content = self.openai_client.download_batch_results(
-                batch_status['output_file_id']
+            # Stream, parse and save translation results
+            self._save_translation_results(
+                job, self.openai_client.iter_batch_results(batch_status['output_file_id'])
             )
             
-            # Parse and save translation results
-            translation_results = self._parse_batch_results(results_content)
-            self._save_translation_results(job, translation_results)
-            
             # Finalize job with all results
             self._finalize_job_results(job)
             
@@ -182,145 +189,170 @@ class BatchMonitor:
             logger.error(f"Error processing translation results for job {job.id}: {str(e)}")
             self.db_manager.update_batch_job_status(str(job.id), 'failed', str(e))
     
-    def _save_vision_results(self, job, vision_results: list):
-        """Save vision results to database"""
+    def _save_vision_results(self, job, vision_results: Iterable[Dict[str, Any]]) -> int:
+        """Save vision results to database, consuming them as they stream; returns the result count"""
         try:
-            # Get all lots for this job
-            lots = self.db_manager.session.query(BatchLot).filter(
+            # Map lot_id -> (id, has a vision result), streamed via ix_batchlot_job_lot without
+            # loading ORM rows or texts
+            lot_rows = self.db_manager.session.query(
+                BatchLot.lot_id, BatchLot.id, (func.length(BatchLot.vision_result) > 0).label('has_result')
+            ).filter(
                 BatchLot.batch_job_id == job.id
-            ).all()
+            ).yield_per(500)
             
-            lot_map = {lot.lot_id: lot for lot in lots}
-            logger.info(f"Processing {len(vision_results)} vision results for job {job.id} with {len(lots)} lots")
+            lot_map = {row.lot_id: (row.id, bool(row.has_result)) for row in lot_rows}
+            logger.info(f"Processing vision results for job {job.id} with {len(lot_map)} lots")
             
+            # Column changes keyed by primary key, merged per lot the way repeated setattr calls
+            # would be, and written with one bulk UPDATE after the stream is consumed
+            lot_updates = {}
+            result_count = 0
             for result in vision_results:
+                result_count += 1
                 if not isinstance(result, dict):
                     logger.warning(f"Skipping non-dict result: {type(result)}")
                     continue
                     
                 custom_id = result.get('custom_id', '')
-                logger.debug(f"Processing result with custom_id: {custom_id}")
                 
                 if not custom_id.startswith('vision:'):
-                    logger.debug(f"Skipping non-vision result: {custom_id}")
+                    logger.debug("Skipping non-vision result: %s", custom_id)
                     continue
                 
-                # Parse custom_id: supports both "vision:lot_id" and "vision:job_id:lot_id"
-                parts = custom_id.split(':')
-                if len(parts) == 2:
-                    # New format: "vision:lot_id"
-                    lot_id = parts[1]
-                elif len(parts) >= 3:
-                    # Old format: "vision:job_id:lot_id"
-                    lot_id = parts[2]
-                else:
-                    logger.warning(f"Invalid custom_id format: {custom_id}")
-                    continue
+                # Parse custom_id: the lot_id is the last segment of both the new "vision:lot_id"
+                # and the old "vision:job_id:lot_id" format
+                lot_id = custom_id.rpartition(':')[2]
                 response_data = result.get('response', {})
-                logger.info(f"Processing lot {lot_id}")
-                logger.info(f"Response keys: {list(response_data.keys()) if response_data else 'None'}")
                 
-                # Extract vision text from response
+                # Fast path for the expected Responses API shape
                 vision_text = ''
                 if isinstance(response_data, dict):
-                    body = response_data.get('body', {})
-                    logger.info(f"Body keys: {list(body.keys()) if body else 'None'}")
-                    
-                    if isinstance(body, dict):
-                        # For OpenAI Responses API - find the message output with actual text
-                        # Structure: body.output[i] where output[i].type == "message"
-                        output = body.get('output', [])
-                        
-                        if output and isinstance(output, list) and len(output) > 0:
-                            # Find the message output (not reasoning)
-                            message_output = None
-                            for out in output:
-                                if isinstance(out, dict) and out.get('type') == 'message':
-                                    message_output = out
-                                    break
-                            
-                            if message_output:
-                                content = message_output.get('content', [])
-                                if content and isinstance(content, list) and len(content) > 0:
-                                    first_content = content[0]
-                                    if isinstance(first_content, dict):
-                                        vision_text = first_content.get('text', '')
-                                        if vision_text:
-                                            logger.info(f"Extracted text from message output for lot {lot_id}: {len(vision_text)} chars")
-                                        else:
-                                            logger.warning(f"No text in content for lot {lot_id}")
-                                    else:
-                                        logger.warning(f"First content is not dict for lot {lot_id}: {type(first_content)}")
-                                else:
-                                    logger.warning(f"No content in message output for lot {lot_id}")
-                            else:
-                                logger.warning(f"No message output found for lot {lot_id}, available types: {[out.get('type') for out in output if isinstance(out, dict)]}")
-                        else:
-                            # Legacy fallback to choices format (for older chat completions)
-                            choices = body.get('choices', [])
-                            logger.info(f"Trying choices fallback, choices count: {len(choices) if choices else 0}")
-                            if choices and len(choices) > 0:
-                                message = choices[0].get('message', {})
-                                content = message.get('content', '')
-                                if content:
-                                    vision_text = content
-                                    logger.info(f"Found content in choices for lot {lot_id}: {len(content)} chars")
-                                else:
-                                    logger.warning(f"No content in message for lot {lot_id}")
-                            else:
-                                # Final fallback - check if text field has actual content (not just format)
-                                text = body.get('text', '')
-                                if isinstance(text, str) and text and not text.startswith('{'):
-                                    vision_text = text
-                                    logger.info(f"Found text string in text field for lot {lot_id}: {len(text)} chars")
-                                else:
-                                    logger.warning(f"No valid output or choices for lot {lot_id}")
-                    else:
-                        logger.warning(f"Body is not dict for lot {lot_id}: {type(body)}")
-                else:
-                    logger.warning(f"Response_data is not dict for lot {lot_id}: {type(response_data)}")
+                    vision_text = response_output_text(response_data.get('body'))
+                
+                if not vision_text:
+                    vision_text = self._explain_missing_vision_text(lot_id, response_data)
                 
                 # Log final vision_text status
-                if vision_text:
-                    logger.info(f"SUCCESS: Got vision text for lot {lot_id}: {len(vision_text)} characters")
-                else:
-                    logger.error(f"FAILED: No vision text extracted for lot {lot_id}")
+                if not vision_text:
+                    logger.error("FAILED: No vision text extracted for lot %s", lot_id)
                 
                 # Update lot with vision result
                 if lot_id in lot_map:
-                    lot = lot_map[lot_id]
+                    lot_pk = lot_map[lot_id][0]
                     if vision_text and isinstance(vision_text, str):
-                        setattr(lot, 'vision_result', vision_text)
-                        setattr(lot, 'status', 'processing')  # Will be completed after translations
-                        setattr(lot, 'updated_at', datetime.utcnow())
-                        logger.info(f"Vision result saved for lot {lot_id}: {len(vision_text)} characters")
+                        lot_updates.setdefault(lot_pk, {'id': lot_pk}).update({
+                            'vision_result': vision_text,
+                            'status': 'processing'  # Will be completed after translations
+                        })
+                        logger.debug("Vision result saved for lot %s: %d characters", lot_id, len(vision_text))
                     else:
-                        setattr(lot, 'status', 'failed')
-                        setattr(lot, 'error_message', f'No valid vision result: {type(vision_text)} - {str(vision_text)[:100]}')
-                        setattr(lot, 'updated_at', datetime.utcnow())
+                        lot_updates.setdefault(lot_pk, {'id': lot_pk}).update({
+                            'status': 'failed',
+                            'error_message': f'No valid vision result: {type(vision_text)} - {str(vision_text)[:100]}'
+                        })
                         logger.error(f"No vision result for lot {lot_id}: {type(vision_text)} - {str(vision_text)[:100]}")
                 else:
                     logger.warning(f"Lot {lot_id} not found in job {job.id}")
             
+            if lot_updates:
+                self.db_manager.session.execute(update(BatchLot), list(lot_updates.values()))
+            
             # Update job progress
-            successful_lots = len([lot for lot in lots if getattr(lot, 'vision_result', None)])
+            successful_lots = sum(
+                1 for lot_pk, has_result in lot_map.values()
+                if has_result or 'vision_result' in lot_updates.get(lot_pk, ())
+            )
             setattr(job, 'processed_lots', successful_lots)
-            setattr(job, 'updated_at', datetime.utcnow())
             
             # Commit changes
             self.db_manager.session.commit()
-            logger.info(f"Saved vision results for job {job.id}: {successful_lots}/{len(lots)} lots processed")
+            logger.info(f"Saved vision results for job {job.id}: {successful_lots}/{len(lot_map)} lots processed from {result_count} results")
             
             # If we have results but no successful lots, there's a parsing issue
-            if len(vision_results) > 0 and successful_lots == 0:
+            if result_count > 0 and successful_lots == 0:
                 logger.error(f"All vision results failed to parse for job {job.id}! Check custom_id format.")
+            
+            return result_count
                     
         except Exception as e:
             self.db_manager.session.rollback()
             logger.error(f"Error saving vision results: {str(e)}")
             raise
     
-    def _save_translation_results(self, job, translation_results: list):
+    def _explain_missing_vision_text(self, lot_id: str, response_data: Any) -> str:
+        """
+        Slow path for a vision result the fast extraction missed: walk the response
+        logging why no text was found, returning any text found by the older shapes
+        """
+        vision_text = ''
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("Processing lot %s, response keys: %s", lot_id,
+                         list(response_data.keys()) if isinstance(response_data, dict) else 'None')
+        
+        # Extract vision text from response
+        if isinstance(response_data, dict):
+            body = response_data.get('body', {})
+            if debug:
+                logger.debug("Body keys: %s", list(body.keys()) if isinstance(body, dict) else 'None')
+        
+            if isinstance(body, dict):
+                # For OpenAI Responses API - find the message output with actual text
+                # Structure: body.output[i] where output[i].type == "message"
+                output = body.get('output', [])
+        
+                if output and isinstance(output, list) and len(output) > 0:
+                    # Find the message output (not reasoning)
+                    message_output = None
+                    for out in output:
+                        if isinstance(out, dict) and out.get('type') == 'message':
+                            message_output = out
+                            break
+        
+                    if message_output:
+                        content = message_output.get('content', [])
+                        if content and isinstance(content, list) and len(content) > 0:
+                            first_content = content[0]
+                            if isinstance(first_content, dict):
+                                vision_text = first_content.get('text', '')
+                                if vision_text:
+                                    logger.debug("Extracted text from message output for lot %s: %d chars", lot_id, len(vision_text))
+                                else:
+                                    logger.warning(f"No text in content for lot {lot_id}")
+                            else:
+                                logger.warning(f"First content is not dict for lot {lot_id}: {type(first_content)}")
+                        else:
+                            logger.warning(f"No content in message output for lot {lot_id}")
+                    else:
+                        logger.warning(f"No message output found for lot {lot_id}, available types: {[out.get('type') for out in output if isinstance(out, dict)]}")
+                else:
+                    # Legacy fallback to choices format (for older chat completions)
+                    choices = body.get('choices', [])
+                    logger.debug("Trying choices fallback, choices count: %d", len(choices) if choices else 0)
+                    if choices and len(choices) > 0:
+                        message = choices[0].get('message', {})
+                        content = message.get('content', '')
+                        if content:
+                            vision_text = content
+                            logger.debug("Found content in choices for lot %s: %d chars", lot_id, len(content))
+                        else:
+                            logger.warning(f"No content in message for lot {lot_id}")
+                    else:
+                        # Final fallback - check if text field has actual content (not just format)
+                        text = body.get('text', '')
+                        if isinstance(text, str) and text and not text.startswith('{'):
+                            vision_text = text
+                            logger.debug("Found text string in text field for lot %s: %d chars", lot_id, len(text))
+                        else:
+                            logger.warning(f"No valid output or choices for lot {lot_id}")
+            else:
+                logger.warning(f"Body is not dict for lot {lot_id}: {type(body)}")
+        else:
+            logger.warning(f"Response_data is not dict for lot {lot_id}: {type(response_data)}")
+        
+        return vision_text
+    
+    def _save_translation_results(self, job, translation_results: Iterable[Dict[str, Any]]):
         """Save translation results to database"""
         try:
             # Get all lots for this job
@@ -350,11 +382,7 @@ class BatchMonitor:
                 # Extract translated text from response
                 translated_text = ''
                 if isinstance(response_data, dict):
-                    body = response_data.get('body', {})
-                    if isinstance(body, dict):
-                        choices = body.get('choices', [{}])
-                        if choices and len(choices) > 0:
-                            translated_text = choices[0].get('message', {}).get('content', '')
+                    translated_text = response_output_text(response_data.get('body'))
                 
                 # Update lot with translation
                 if lot_id in lot_map and translated_text:
@@ -363,7 +391,7 @@ class BatchMonitor:
                     current_translations[language] = translated_text
                     setattr(lot, 'translations', current_translations)
                     setattr(lot, 'updated_at', datetime.utcnow())
-                    logger.info(f"Translation saved for lot {lot_id} in {language}: {len(translated_text)} characters")
+                    logger.debug("Translation saved for lot %s in %s: %d characters", lot_id, language, len(translated_text))
             
             # Mark all lots as completed
             for lot in lots:
@@ -420,20 +448,6 @@ class BatchMonitor:
             logger.error(f"Error finalizing job results: {str(e)}")
             raise
     
-    def _parse_batch_results(self, results_content: str) -> list:
-        """Parse batch results from JSONL content"""
-        results = []
-        try:
-            import json
-            for line in results_content.strip().split('\n'):
-                if line.strip():
-                    result = json.loads(line)
-                    results.append(result)
-            return results
-        except Exception as e:
-            logger.error(f"Error parsing batch results: {str(e)}")
-            return []
-    
     def check_job_status(self, job_id: str):
         """Check single job status and return updated job"""
         try:
@@ -448,7 +462,7 @@ class BatchMonitor:
             logger.error(f"Error checking job status {job_id}: {str(e)}")
             return None
     
-    def _start_translation_batch(self, job, vision_results: Dict[str, Any]):
+    def _start_translation_batch(self, job):
         """Start translation batch for non-English languages"""
         try:
             # Get lots with vision results from database
@@ -460,7 +474,7 @@ class BatchMonitor:
             logger.info(f"Creating translation requests for {len(lots)} lots with vision results")
             
             # Create translation requests
-            translation_requests = []
+            translation_items = []
             
             for lot in lots:
                 english_text = getattr(lot, 'vision_result', None)
@@ -472,25 +486,16 @@ class BatchMonitor:
                     if lang == 'en':
                         continue
                     
-                    request = {
-                        "custom_id": f"translate:{job.id}:{lot.lot_id}:{lang}",
-                        "method": "POST",
-                        "url": "/v1/responses",
-                        "body": {
-                            "model": "gpt-4.1-mini",
-                            "input": f"Translate the following text into {lang} only. Maintain the original formatting and meaning:\\n\\n{english_text}",
-                            "max_output_tokens": 2048
-                        }
-                    }
-                    translation_requests.append(request)
+                    translation_items.append(
+                        (f"translate:{job.id}:{lot.lot_id}:{lang}", english_text, lang)
+                    )
                     
-            logger.info(f"Created {len(translation_requests)} translation requests for job {job.id}")
+            logger.info(f"Created {len(translation_items)} translation requests for job {job.id}")
             
-            if translation_requests:
+            if translation_items:
                 # Submit translation batch
-                jsonl_content = self.openai_client.create_batch_file(translation_requests)
-                translation_batch_id = self.openai_client.submit_batch_job(
-                    jsonl_content, f"Translation for job {job.id}"
+                translation_batch_id = self.openai_client.submit_translation_batch(
+                    translation_items, f"Translation for job {job.id}"
                 )
                 
                 # Update job with translation batch ID
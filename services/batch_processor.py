@@ -1,16 +1,19 @@
-import json
 import logging
 import uuid
 import time
 from typing import List, Dict, Any, Optional
 
-from services.openai_client import OpenAIClient
+from services.openai_client import (
+    OpenAIClient, format_image_list, VISION_IMAGES_HEADER, VISION_IMAGES_FOOTER
+)
 from services.image_validator import ImageValidator
 from services.webhook_handler import WebhookHandler
 from config import MAX_LINES, MAX_FILE_BYTES, MAX_LINE_BYTES
 
 logger = logging.getLogger(__name__)
 
+BATCH_VISION_PREFIX = "Analyze these car images and provide a detailed damage assessment.\n\nAdditional info: "
+
 class BatchProcessor:
     def __init__(self):
         self.openai_client = OpenAIClient()
@@ -86,8 +89,10 @@ class BatchProcessor:
                 
                 # Create input content in text format with image URLs
                 # Image validation will happen during batch processing by OpenAI
-                image_list = "\n".join([f"Image {i+1}: {url}" for i, url in enumerate(lot['image_urls'])])
-                input_text = f"Analyze these car images and provide a detailed damage assessment.\n\nAdditional info: {lot['additional_info']}\n\nProvided images:\n{image_list}\n\nNote: Analyze based on the context provided above."
+                input_text = "".join((
+                    BATCH_VISION_PREFIX, str(lot['additional_info']),
+                    VISION_IMAGES_HEADER, format_image_list(lot['image_urls']), VISION_IMAGES_FOOTER
+                ))
                 
                 vision_request = {
                     "custom_id": vision_custom_id,
@@ -107,18 +112,15 @@ class BatchProcessor:
             if vision_requests:
                 # Quick check for batch limits
                 vision_jsonl = self.openai_client.create_batch_file(vision_requests[:1000])  # Limit to 1000 requests for fast creation
-                estimated_size = len(vision_jsonl.encode()) * len(vision_requests) / min(len(vision_requests), 1000)
+                estimated_size = len(vision_jsonl) * len(vision_requests) / min(len(vision_requests), 1000)
                 
                 if estimated_size > MAX_FILE_BYTES:
                     raise ValueError(f"Estimated batch file too large: {estimated_size} > {MAX_FILE_BYTES}")
                 
-                # Create full batch file
-                vision_jsonl = self.openai_client.create_batch_file(vision_requests)
-                
-                # Submit with timeout protection  
+                # Stream the full batch file into the upload and submit with timeout protection
                 try:
-                    vision_batch_id = self.openai_client.submit_batch_job(
-                        vision_jsonl, 
+                    vision_batch_id = self.openai_client.submit_batch_requests(
+                        vision_requests,
                         f"Vision processing for job {job_id}"
                     )
                 except Exception as e:
@@ -211,29 +213,24 @@ class BatchProcessor:
             return
         
         try:
-            # Download results
-            results_content = self.openai_client.download_batch_results(vision_status['output_file_id'])
-            
-            # Parse results
+            # Stream and parse results
             vision_results = {}
-            for line in results_content.strip().split('\n'):
-                if line:
-                    result = json.loads(line)
-                    custom_id = result['custom_id']
+            for result in self.openai_client.iter_batch_results(vision_status['output_file_id']):
+                custom_id = result['custom_id']
+                
+                if custom_id.startswith('vision:'):
+                    lot_id = custom_id.replace('vision:', '')
                     
-                    if custom_id.startswith('vision:'):
-                        lot_id = custom_id.replace('vision:', '')
-                        
-                        if result.get('response'):
-                            response_body = result['response']['body']
-                            if response_body.get('output_text'):
-                                vision_results[lot_id] = response_body['output_text']
-                            else:
-                                logger.warning(f"No output_text for lot {lot_id}")
-                                vision_results[lot_id] = "No description available"
+                    if result.get('response'):
+                        response_body = result['response']['body']
+                        if response_body.get('output_text'):
+                            vision_results[lot_id] = response_body['output_text']
                         else:
-                            logger.error(f"No response for lot {lot_id}: {result.get('error', 'Unknown error')}")
-                            vision_results[lot_id] = "Error generating description"
+                            logger.warning(f"No output_text for lot {lot_id}")
+                            vision_results[lot_id] = "No description available"
+                    else:
+                        logger.error(f"No response for lot {lot_id}: {result.get('error', 'Unknown error')}")
+                        vision_results[lot_id] = "Error generating description"
             
             # Store vision results in database 
             # This would be handled by storing individual lot results
@@ -263,27 +260,15 @@ class BatchProcessor:
             return
         
         try:
-            translation_requests = []
-            
-            for lot_id, english_text in vision_results.items():
-                for lang in languages:
-                    translation_custom_id = f"tr:{lot_id}:{lang}"
-                    translation_request = {
-                        "custom_id": translation_custom_id,
-                        "method": "POST",
-                        "url": "/v1/responses",
-                        "body": {
-                            "model": "gpt-4.1-mini",
-                            "input": f"Translate the following text into {lang} only. Maintain the original formatting and meaning:\n\n{english_text}",
-                            "max_output_tokens": 2048
-                        }
-                    }
-                    translation_requests.append(translation_request)
+            translation_items = [
+                (f"tr:{lot_id}:{lang}", english_text, lang)
+                for lot_id, english_text in vision_results.items()
+                for lang in languages
+            ]
             
-            if translation_requests:
-                translation_jsonl = self.openai_client.create_batch_file(translation_requests)
-                translation_batch_id = self.openai_client.submit_batch_job(
-                    translation_jsonl,
+            if translation_items:
+                translation_batch_id = self.openai_client.submit_translation_batch(
+                    translation_items,
                     f"Translation processing for job {job_id}"
                 )
                 self.db_manager.update_batch_job_openai_id(job_id, translation_batch_id, 'translation')
@@ -303,33 +288,29 @@ class BatchProcessor:
             return
         
         try:
-            results_content = self.openai_client.download_batch_results(translation_status['output_file_id'])
-            
-            # Parse translation results
+            # Stream and parse translation results
             translation_results = {}
-            for line in results_content.strip().split('\n'):
-                if line:
-                    result = json.loads(line)
-                    custom_id = result['custom_id']
-                    
-                    if custom_id.startswith('tr:'):
-                        parts = custom_id.split(':')
-                        if len(parts) >= 3:
-                            lot_id = parts[1]
-                            language = parts[2]
-                            
-                            if lot_id not in translation_results:
-                                translation_results[lot_id] = {}
-                            
-                            if result.get('response'):
-                                response_body = result['response']['body']
-                                if response_body.get('output_text'):
-                                    translation_results[lot_id][language] = response_body['output_text']
-                                else:
-                                    translation_results[lot_id][language] = "Translation failed"
+            for result in self.openai_client.iter_batch_results(translation_status['output_file_id']):
+                custom_id = result['custom_id']
+                
+                if custom_id.startswith('tr:'):
+                    parts = custom_id.split(':')
+                    if len(parts) >= 3:
+                        lot_id = parts[1]
+                        language = parts[2]
+                        
+                        if lot_id not in translation_results:
+                            translation_results[lot_id] = {}
+                        
+                        if result.get('response'):
+                            response_body = result['response']['body']
+                            if response_body.get('output_text'):
+                                translation_results[lot_id][language] = response_body['output_text']
                             else:
-                                logger.error(f"Translation failed for {lot_id}:{language}: {result.get('error', 'Unknown error')}")
                                 translation_results[lot_id][language] = "Translation failed"
+                        else:
+                            logger.error(f"Translation failed for {lot_id}:{language}: {result.get('error', 'Unknown error')}")
+                            translation_results[lot_id][language] = "Translation failed"
             
             # Store translation results in database - handled by monitor service
             
@@ -389,8 +370,7 @@ class BatchProcessor:
                     webhook_groups[webhook_url].append(lot_result)
             
             # Send webhooks
-            for webhook_url, lots_data in webhook_groups.items():
-                self.webhook_handler.send_webhook(webhook_url, lots_data)
+            self.webhook_handler.send_webhooks(webhook_groups)
             
         except Exception as e:
             logger.error(f"Webhook sending failed for {job_id}: {str(e)}")
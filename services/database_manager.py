@@ -1,9 +1,12 @@
 import logging
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
+import orjson
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, or_, case, update
+from sqlalchemy.orm import load_only
 from database.models import BatchJob, BatchLot, BatchResult, WebhookDelivery
+from config import WEBHOOK_RETRY_BACKOFF, WEBHOOK_MAX_ATTEMPTS
 
 logger = logging.getLogger(__name__)
 
@@ -71,7 +74,6 @@ class DatabaseManager:
                 return False
             
             batch_job.status = status
-            batch_job.updated_at = datetime.utcnow()
             if error_message:
                 batch_job.error_message = error_message
             
@@ -98,7 +100,6 @@ class DatabaseManager:
             elif batch_type == 'translation':
                 batch_job.openai_translation_batch_id = openai_batch_id
             
-            batch_job.updated_at = datetime.utcnow()
             self.session.commit()
             
             logger.info(f"Updated batch job {job_id} {batch_type} batch ID to {openai_batch_id}")
@@ -115,6 +116,8 @@ class DatabaseManager:
         Also includes failed jobs that might have completed OpenAI batches
         """
         try:
+            # Full rows: the monitor and worker read languages, webhook_url and
+            # updated_at on every polled job, so deferring them costs a SELECT each
             return self.session.query(BatchJob).filter(
                 BatchJob.status.in_(['pending', 'processing', 'failed'])
             ).filter(
@@ -135,10 +138,11 @@ class DatabaseManager:
                 return False
             
             # Create batch result record
+            payload = orjson.dumps(results_data)
             batch_result = BatchResult(
                 batch_job_id=batch_job.id,
                 result_data=results_data,
-                file_size=len(str(results_data).encode('utf-8'))
+                file_size=len(payload)
             )
             
             # Update lot results
@@ -155,13 +159,11 @@ class DatabaseManager:
                     lot.status = 'completed'
                     lot.vision_result = lot_result.get('vision_result')
                     lot.translations = lot_result.get('translations', {})
-                    lot.updated_at = datetime.utcnow()
             
             # Update job progress
             batch_job.processed_lots = len([l for l in lots_data if l.get('status') == 'completed'])
             batch_job.failed_lots = len([l for l in lots_data if l.get('status') == 'failed'])
             batch_job.status = 'completed'
-            batch_job.updated_at = datetime.utcnow()
             
             self.session.add(batch_result)
             self.session.commit()
@@ -206,69 +208,6 @@ class DatabaseManager:
             return []
     
 
-    def mark_webhook_delivered(self, webhook_id: str) -> bool:
-        """
-        Mark webhook as successfully delivered
-        """
-        try:
-            webhook = self.session.query(WebhookDelivery).filter(
-                WebhookDelivery.id == webhook_id
-            ).first()
-            
-            if webhook:
-                webhook.status = 'delivered'
-                webhook.delivered_at = datetime.utcnow()
-                self.session.commit()
-                return True
-            return False
-        except SQLAlchemyError as e:
-            self.session.rollback()
-            logger.error(f"Database error marking webhook delivered: {str(e)}")
-            return False
-    
-    def mark_webhook_failed(self, webhook_id: str, error_message: str) -> bool:
-        """
-        Mark webhook as permanently failed
-        """
-        try:
-            webhook = self.session.query(WebhookDelivery).filter(
-                WebhookDelivery.id == webhook_id
-            ).first()
-            
-            if webhook:
-                webhook.status = 'failed'
-                webhook.error_message = error_message
-                webhook.last_attempt_at = datetime.utcnow()
-                self.session.commit()
-                return True
-            return False
-        except SQLAlchemyError as e:
-            self.session.rollback()
-            logger.error(f"Database error marking webhook failed: {str(e)}")
-            return False
-    
-    def update_webhook_attempt(self, webhook_id: str, attempt_count: int, next_attempt_at: datetime, error_message: str) -> bool:
-        """
-        Update webhook attempt information
-        """
-        try:
-            webhook = self.session.query(WebhookDelivery).filter(
-                WebhookDelivery.id == webhook_id
-            ).first()
-            
-            if webhook:
-                webhook.attempt_count = attempt_count
-                webhook.next_attempt_at = next_attempt_at
-                webhook.last_attempt_at = datetime.utcnow()
-                webhook.error_message = error_message
-                self.session.commit()
-                return True
-            return False
-        except SQLAlchemyError as e:
-            self.session.rollback()
-            logger.error(f"Database error updating webhook attempt: {str(e)}")
-            return False
-    
     def create_webhook_delivery(self, job_id: str, webhook_url: str, payload: Dict[str, Any], signature: str) -> str:
         """
         Create webhook delivery record
@@ -303,10 +242,16 @@ class DatabaseManager:
                 return all pending or failed deliveries regardless of schedule.
         """
         try:
-            query = self.session.query(WebhookDelivery).filter(
+            # Delivery needs the target, body and signature; response/error text is never read here
+            query = self.session.query(WebhookDelivery).options(
+                load_only(
+                    WebhookDelivery.id, WebhookDelivery.webhook_url, WebhookDelivery.payload,
+                    WebhookDelivery.signature, WebhookDelivery.attempt_count
+                )
+            ).filter(
                 and_(
                     WebhookDelivery.status.in_(['pending', 'failed']),
-                    WebhookDelivery.attempt_count < 5
+                    WebhookDelivery.attempt_count < WEBHOOK_MAX_ATTEMPTS
                 )
             )
 
@@ -323,43 +268,59 @@ class DatabaseManager:
             logger.error(f"Database error getting pending webhooks: {str(e)}")
             return []
     
-    def update_webhook_delivery(self, delivery_id: str, status: str, response_status: int = None, 
-                               response_body: str = None, error_message: str = None) -> bool:
+    def finalize_webhook(self, delivery_id: str, outcome: str, response_status: int = None,
+                         response_body: str = None, error_message: str = None) -> bool:
         """
-        Update webhook delivery status
+        Record the outcome of a webhook delivery attempt in a single UPDATE
+
+        Args:
+            outcome: 'delivered', 'retry' (schedule next attempt from
+                WEBHOOK_RETRY_BACKOFF, failing once attempts run out) or
+                'failed' (give up without counting another attempt)
         """
         try:
-            delivery = self.session.query(WebhookDelivery).filter(
-                WebhookDelivery.id == delivery_id
-            ).first()
-            
-            if not delivery:
-                return False
-            
-            delivery.status = status
-            delivery.attempt_count += 1
-            delivery.last_attempt_at = datetime.utcnow()
-            
-            if status == 'delivered':
-                delivery.delivered_at = datetime.utcnow()
-            elif status == 'failed' and delivery.attempt_count < 5:
-                # Schedule next retry with exponential backoff
-                delay_seconds = 2 ** delivery.attempt_count
-                delivery.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay_seconds)
+            now = datetime.utcnow()
+            values: Dict[str, Any] = {'last_attempt_at': now}
+            
+            if outcome == 'delivered':
+                values['status'] = 'delivered'
+                values['delivered_at'] = now
+                values['attempt_count'] = WebhookDelivery.attempt_count + 1
+            elif outcome == 'retry':
+                values['attempt_count'] = WebhookDelivery.attempt_count + 1
+                values['next_attempt_at'] = case(
+                    *[(WebhookDelivery.attempt_count == attempt, now + timedelta(seconds=delay))
+                      for attempt, delay in enumerate(WEBHOOK_RETRY_BACKOFF)],
+                    else_=now + timedelta(seconds=WEBHOOK_RETRY_BACKOFF[-1])
+                )
+                values['status'] = case(
+                    (WebhookDelivery.attempt_count + 1 >= WEBHOOK_MAX_ATTEMPTS, 'failed'),
+                    else_=WebhookDelivery.status
+                )
+            elif outcome == 'failed':
+                values['status'] = 'failed'
+            else:
+                raise ValueError(f"Unknown webhook outcome: {outcome}")
             
-            if response_status:
-                delivery.response_status = response_status
+            if response_status is not None:
+                values['response_status'] = response_status
             if response_body:
-                delivery.response_body = response_body[:1000]  # Limit size
+                values['response_body'] = response_body[:1000]  # Limit size
             if error_message:
-                delivery.error_message = error_message
+                values['error_message'] = error_message[:500]  # Limit size
             
+            result = self.session.execute(
+                update(WebhookDelivery)
+                .where(WebhookDelivery.id == delivery_id)
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
             self.session.commit()
-            return True
+            return result.rowcount > 0
             
         except SQLAlchemyError as e:
             self.session.rollback()
-            logger.error(f"Database error updating webhook delivery: {str(e)}")
+            logger.error(f"Database error finalizing webhook delivery: {str(e)}")
             return False
     
     def cleanup_old_jobs(self, days: int = 7) -> int:
@@ -1,30 +1,48 @@
 import logging
-import requests
-from typing import List, Tuple
+import httpx
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, List, Tuple
 from urllib.parse import urlparse
 from config import (
     IMAGE_HEAD_TIMEOUT, IMAGE_GET_TIMEOUT, 
-    IMAGE_GET_MAX_SIZE, MAX_IMAGE_SIZE
+    IMAGE_GET_MAX_SIZE, MAX_IMAGE_SIZE, IMAGE_VALIDATION_WORKERS,
+    IMAGE_CHECK_CACHE_TTL, IMAGE_REVALIDATE_TTL
 )
+from utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+@lru_cache(maxsize=8192)
+def validate_url_format(url: str) -> bool:
+    """
+    Basic URL format validation
+    """
+    try:
+        parsed = urlparse(url)
+        return all([parsed.scheme in ['http', 'https'], parsed.netloc])
+    except Exception:
+        return False
+
 class ImageValidator:
     def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Generation-Service/1.0.0'
-        })
+        # HTTP/2 lets checks against the same image host share one connection
+        self.session = httpx.Client(
+            http2=True,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+            headers={'User-Agent': 'Generation-Service/1.0.0'},
+            timeout=httpx.Timeout(IMAGE_HEAD_TIMEOUT)
+        )
+        # Recently confirmed URLs; failures are not cached so they get rechecked
+        self._accessibility_cache = TTLCache(maxsize=4096, ttl=IMAGE_CHECK_CACHE_TTL)
+        # ETag / Last-Modified of confirmed images, used to revalidate with a conditional HEAD
+        self._validator_cache = TTLCache(maxsize=4096, ttl=IMAGE_REVALIDATE_TTL)
     
     def validate_url_format(self, url: str) -> bool:
         """
         Basic URL format validation
         """
-        try:
-            parsed = urlparse(url)
-            return all([parsed.scheme in ['http', 'https'], parsed.netloc])
-        except Exception:
-            return False
+        return validate_url_format(url)
     
     def check_image_accessibility(self, url: str) -> Tuple[bool, str]:
         """
@@ -34,9 +52,29 @@ class ImageValidator:
         if not self.validate_url_format(url):
             return False, "Invalid URL format"
         
+        cached = self._accessibility_cache.get(url)
+        if cached is not None:
+            return cached
+        
+        is_valid, error_msg = self._fetch_image_accessibility(url)
+        if is_valid:
+            self._accessibility_cache.set(url, (is_valid, error_msg))
+        return is_valid, error_msg
+    
+    def _fetch_image_accessibility(self, url: str) -> Tuple[bool, str]:
+        """
+        Perform the HEAD / ranged GET checks for a single URL
+        """
         try:
-            # Try HEAD request first with proper redirect handling
-            response = self.session.head(url, timeout=IMAGE_HEAD_TIMEOUT, allow_redirects=True)
+            # Try HEAD request first with proper redirect handling; revalidate
+            # conditionally if this image was confirmed before
+            response = self.session.head(
+                url, follow_redirects=True, headers=self._validator_cache.get(url, {})
+            )
+            
+            # Unchanged since the last successful check
+            if response.status_code == 304:
+                return True, ""
             
             # Accept redirects (3xx) and success (2xx) codes
             if response.status_code >= 200 and response.status_code < 400:
@@ -55,60 +93,88 @@ class ImageValidator:
                     except ValueError:
                         pass
                 
+                self._remember_validators(url, response.headers)
                 return True, ""
             
-            # If HEAD fails, try GET with limited size
-            response = self.session.get(
-                url, 
-                timeout=IMAGE_GET_TIMEOUT, 
-                stream=True,
-                allow_redirects=True,
+            # If HEAD fails, try GET with limited size (body is never read)
+            with self.session.stream(
+                'GET',
+                url,
+                timeout=IMAGE_GET_TIMEOUT,
+                follow_redirects=True,
                 headers={'Range': f'bytes=0-{IMAGE_GET_MAX_SIZE}'}
-            )
-            
-            # Accept redirects (3xx) and success (2xx) codes
-            if response.status_code >= 200 and response.status_code < 400:
-                content_type = response.headers.get('Content-Type', '').lower()
-                if not content_type.startswith('image/'):
-                    return False, f"Invalid content type: {content_type}"
-                return True, ""
-            
-            return False, f"HTTP {response.status_code}"
+            ) as response:
+                # Accept redirects (3xx) and success (2xx) codes
+                if response.status_code >= 200 and response.status_code < 400:
+                    content_type = response.headers.get('Content-Type', '').lower()
+                    if not content_type.startswith('image/'):
+                        return False, f"Invalid content type: {content_type}"
+                    return True, ""
+                
+                return False, f"HTTP {response.status_code}"
             
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             return False, "Request timeout"
-        except requests.exceptions.ConnectionError:
+        except httpx.NetworkError:
             return False, "Connection error"
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             return False, f"Request error: {str(e)}"
         except Exception as e:
             return False, f"Unexpected error: {str(e)}"
     
+    def _remember_validators(self, url: str, headers: httpx.Headers) -> None:
+        """
+        Store conditional request headers for a successfully checked image
+        """
+        validators: Dict[str, str] = {}
+        etag = headers.get('ETag')
+        if etag:
+            validators['If-None-Match'] = etag
+        last_modified = headers.get('Last-Modified')
+        if last_modified:
+            validators['If-Modified-Since'] = last_modified
+        if validators:
+            self._validator_cache.set(url, validators)
+    
     def validate_images(self, image_urls: List[str]) -> Tuple[List[str], List[str]]:
         """
         Validate list of image URLs
+        Checks run concurrently; verdicts are consumed in input order so the
+        consecutive-failure cutoff behaves the same as a sequential scan.
         Returns (valid_urls, unreachable_urls)
         """
         valid_urls = []
         unreachable_urls = []
         consecutive_failures = 0
         
-        for url in image_urls:
-            is_valid, error_msg = self.check_image_accessibility(url)
+        if not image_urls:
+            return valid_urls, unreachable_urls
+        
+        # Each distinct URL is checked once; duplicates reuse its verdict
+        unique_urls = list(dict.fromkeys(image_urls))
+        executor = ThreadPoolExecutor(max_workers=min(IMAGE_VALIDATION_WORKERS, len(unique_urls)))
+        try:
+            futures = {url: executor.submit(self.check_image_accessibility, url) for url in unique_urls}
             
-            if is_valid:
-                valid_urls.append(url)
-                consecutive_failures = 0
-            else:
-                unreachable_urls.append(url)
-                consecutive_failures += 1
-                logger.warning(f"Image validation failed for {url}: {error_msg}")
+            for index, url in enumerate(image_urls):
+                is_valid, error_msg = futures[url].result()
                 
-                # Stop validation if too many consecutive failures
-                if consecutive_failures >= 2:
-                    logger.warning("Too many consecutive image validation failures, marking remaining as unreachable")
-                    unreachable_urls.extend(image_urls[len(valid_urls) + len(unreachable_urls):])
-                    break
+                if is_valid:
+                    valid_urls.append(url)
+                    consecutive_failures = 0
+                else:
+                    unreachable_urls.append(url)
+                    consecutive_failures += 1
+                    logger.warning(f"Image validation failed for {url}: {error_msg}")
+                    
+                    # Stop validation if too many consecutive failures
+                    if consecutive_failures >= 2:
+                        logger.warning("Too many consecutive image validation failures, marking remaining as unreachable")
+                        unreachable_urls.extend(image_urls[index + 1:])
+                        break
+        finally:
+            # Drop checks that have not started yet once the outcome is known
+            executor.shutdown(wait=False, cancel_futures=True)
         
         return valid_urls, unreachable_urls
     
@@ -1,13 +1,120 @@
-import json
+import asyncio
+import hashlib
+import io
 import logging
+import tempfile
 import time
-from typing import List, Dict, Any, Optional
-from openai import OpenAI
-from config import OPENAI_API_KEY, VISION_SYSTEM_PROMPT
+from functools import lru_cache
+from typing import BinaryIO, Iterable, Iterator, List, Dict, Any, Optional, Tuple, Union
+import orjson
+from openai import AsyncOpenAI, OpenAI
+from config import (
+    OPENAI_API_KEY, VISION_SYSTEM_PROMPT,
+    TRANSLATION_CACHE_SIZE, TRANSLATION_CACHE_TTL, TRANSLATION_CONCURRENCY,
+    VISION_CACHE_SIZE, VISION_CACHE_TTL, VISION_CONTEXT_TOKENS
+)
+from utils.cache import TTLCache
 from utils.retry import retry_with_backoff
 
 logger = logging.getLogger(__name__)
 
+# Prompt pieces for text-only vision requests, built once at import
+VISION_CONTEXT_PREFIX = VISION_SYSTEM_PROMPT + "\n\nAdditional context: "
+VISION_IMAGES_HEADER = "\n\nProvided images:\n"
+VISION_IMAGES_FOOTER = "\n\nNote: Analyze based on the context provided above."
+IMAGE_LINE = "Image {}: {}".format
+
+def format_image_list(images: List[str]) -> str:
+    """
+    Render image URLs as numbered "Image N: url" lines
+    """
+    return "\n".join(IMAGE_LINE(i, url) for i, url in enumerate(images, 1))
+
+def build_vision_input(user_prompt: str, images: List[str]) -> str:
+    """
+    Full text input for a vision request
+    For now, use text-only input until multimodal support in Responses API is stable,
+    so image URLs are listed as text
+    """
+    if not images:
+        return user_prompt
+    return "".join((user_prompt, VISION_IMAGES_HEADER, format_image_list(images), VISION_IMAGES_FOOTER))
+
+# Rough characters-per-token ratio for plain-text prompts, used to pre-check context size
+CHARS_PER_TOKEN = 4
+VISION_MAX_OUTPUT_TOKENS = 2048
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate for prompt text, no tokenizer needed
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+# Estimates for the fixed prompt parts, computed once
+VISION_PROMPT_TOKENS = estimate_tokens(VISION_SYSTEM_PROMPT)
+VISION_FRAME_TOKENS = estimate_tokens(VISION_IMAGES_HEADER + VISION_IMAGES_FOOTER)
+
+def fit_images_to_context(user_prompt: str, images: List[str],
+                          max_tokens: int = VISION_CONTEXT_TOKENS - VISION_MAX_OUTPUT_TOKENS) -> List[str]:
+    """
+    Drop trailing images whose URL lines would push the prompt past the context window
+    Always keeps the first image so a request is still made
+    """
+    prompt_tokens = VISION_PROMPT_TOKENS if user_prompt == VISION_SYSTEM_PROMPT else estimate_tokens(user_prompt)
+    used = prompt_tokens + VISION_FRAME_TOKENS
+    for count, url in enumerate(images):
+        used += estimate_tokens(IMAGE_LINE(count + 1, url)) + 1
+        if used > max_tokens and count > 0:
+            return images[:count]
+    return images
+
+# Batch JSONL is spooled in memory up to this size, then to a temp file on disk
+BATCH_SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+@lru_cache(maxsize=256)
+def translation_prefix(target_language: str) -> str:
+    """
+    Fixed instruction that precedes the text in every translation request for a language
+    """
+    return f"Translate the following text into {target_language} only. Maintain the original formatting and meaning:\n\n"
+
+# Completed translations shared by all clients in the process
+_translation_cache = TTLCache(maxsize=TRANSLATION_CACHE_SIZE, ttl=TRANSLATION_CACHE_TTL)
+TRANSLATION_CACHE_MIN_CHARS = 20
+TRANSLATION_CACHE_MAX_CHARS = 4096
+
+def translation_cache_key(text: str, target_language: str) -> Optional[tuple]:
+    """
+    Cache key for a translation, or None if the text is too short or too long to cache
+    """
+    if not TRANSLATION_CACHE_MIN_CHARS <= len(text) <= TRANSLATION_CACHE_MAX_CHARS:
+        return None
+    digest = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+    return digest, target_language.lower()
+
+# Vision descriptions keyed by image set + context
+_vision_cache = TTLCache(maxsize=VISION_CACHE_SIZE, ttl=VISION_CACHE_TTL)
+
+def vision_cache_key(images: List[str], additional_info: str) -> bytes:
+    """
+    Cache key for a vision description: the sorted image URLs plus additional_info
+    """
+    hasher = hashlib.sha256()
+    for url in sorted(images):
+        hasher.update(url.encode('utf-8'))
+        hasher.update(b"\0")
+    hasher.update(str(additional_info or "").encode('utf-8'))
+    return hasher.digest()
+
+def llm_cache_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Hit/miss counters for the in-process translation and vision caches
+    """
+    return {
+        'translation': _translation_cache.stats(),
+        'vision': _vision_cache.stats()
+    }
+
 class OpenAIClient:
     def __init__(self):
         # Configure client with proper timeout settings to prevent worker timeouts
@@ -17,27 +124,55 @@ class OpenAIClient:
             max_retries=2
         )
     
-    @retry_with_backoff()
     def generate_vision_description(self, images: List[str], additional_info: str = "") -> str:
         """
         Generate car description using OpenAI o4-mini model via Responses API
+        Falls back to the first image only if the full prompt exceeds the context window
+        """
+        cache_key = vision_cache_key(images, additional_info)
+        cached = _vision_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        # Prepare the user prompt with additional context
+        if additional_info:
+            user_prompt = VISION_CONTEXT_PREFIX + str(additional_info)
+        else:
+            user_prompt = VISION_SYSTEM_PROMPT
+        
+        # Trim images up front rather than paying for a context_length error
+        requested_count = len(images)
+        fitted_images = fit_images_to_context(user_prompt, images)
+        if len(fitted_images) < len(images):
+            logger.warning(f"Trimming images from {len(images)} to {len(fitted_images)} to fit context window")
+            images = fitted_images
+        
+        # Each subset gets its own retry chain inside _call_vision
+        subsets = [images, images[:1]] if len(images) > 1 else [images]
+        for index, subset in enumerate(subsets):
+            try:
+                description, complete = self._call_vision(build_vision_input(user_prompt, subset), len(subset))
+            except Exception as e:
+                if "context_length" in str(e).lower() and index < len(subsets) - 1:
+                    logger.info("Retrying with first image only due to context length")
+                    continue
+                raise
+            
+            # The key covers every requested image; a reply for fewer of them isn't cached
+            if description and complete and len(subset) == requested_count:
+                _vision_cache.set(cache_key, description)
+            return description
+    
+    @retry_with_backoff()
+    def _call_vision(self, input_content: str, image_count: int) -> Tuple[str, bool]:
+        """
+        Single vision request for a prebuilt prompt, reused as-is across retries
+        Returns (description, complete) where complete is False for a partial reply
         """
         # Log request start for debugging timeout issues
         start_time = time.time()
         try:
-            logger.info(f"Starting vision description generation for {len(images)} images")
-            
-            # Prepare the user prompt with additional context
-            user_prompt = f"{VISION_SYSTEM_PROMPT}\n\nAdditional context: {additional_info}" if additional_info else VISION_SYSTEM_PROMPT
-            
-            # For now, use text-only input until multimodal support in Responses API is stable
-            # Format all information including image URLs as text input
-            if len(images) == 0:
-                input_content = user_prompt
-            else:
-                # Include image URLs in text format for now
-                image_list = "\n".join([f"Image {i+1}: {url}" for i, url in enumerate(images)])
-                input_content = f"{user_prompt}\n\nProvided images:\n{image_list}\n\nNote: Analyze based on the context provided above."
+            logger.info(f"Starting vision description generation for {image_count} images")
             
             # Make request to Responses API using o4-mini model
             # the newest OpenAI model is "o4-mini" which was released after knowledge cutoff.
@@ -46,7 +181,7 @@ class OpenAIClient:
                 model="o4-mini",
                 reasoning={"effort": "medium"},
                 input=input_content,
-                max_output_tokens=2048
+                max_output_tokens=VISION_MAX_OUTPUT_TOKENS
             )
             
             # Log completion time
@@ -56,93 +191,182 @@ class OpenAIClient:
             if response.status == "incomplete":
                 logger.warning(f"Incomplete response: {response.incomplete_details}")
                 if response.output_text:
-                    return response.output_text
+                    return response.output_text, False
                 else:
                     raise Exception("Response incomplete during reasoning phase")
             
-            return response.output_text or ""
+            return response.output_text or "", True
             
         except Exception as e:
-            try:
-                duration = time.time() - start_time
-            except NameError:
-                duration = 0
+            duration = time.time() - start_time
             logger.error(f"Vision API error after {duration:.2f}s: {str(e)}")
-            
-            if "context_length" in str(e).lower():
-                # Try with fewer images or shorter prompt
-                if len(images) > 1:
-                    logger.info("Retrying with first image only due to context length")
-                    return self.generate_vision_description(images[:1], additional_info)
-            raise e
+            raise
     
-    @retry_with_backoff()
-    def translate_text(self, text: str, target_language: str) -> str:
+    def _cached_translation(self, text: str, target_language: str) -> Tuple[Optional[tuple], Optional[str]]:
+        """
+        Cache key for a translation plus the result if no request is needed
+        English targets return the text itself; cached translations are returned as-is
+        """
+        if target_language.lower() == 'en':
+            return None, text
+        
+        cache_key = translation_cache_key(text, target_language)
+        if cache_key is not None:
+            cached = _translation_cache.get(cache_key)
+            if cached is not None:
+                return cache_key, cached
+        return cache_key, None
+    
+    def _finish_translation(self, response, text: str, target_language: str,
+                            cache_key: Optional[tuple]) -> str:
+        """
+        Turn a translation response into the translated text, caching complete replies
+        Falls back to the original text when the reply is empty
+        """
+        if response.status == "incomplete":
+            logger.warning(f"Translation incomplete: {response.incomplete_details}")
+            if not response.output_text:
+                logger.warning(f"Translation failed, returning original text for {target_language}")
+            return response.output_text or text
+        
+        if response.output_text and cache_key is not None:
+            _translation_cache.set(cache_key, response.output_text)
+        return response.output_text or text
+    
+    async def translate_text_async(self, aclient: AsyncOpenAI, text: str, target_language: str) -> str:
         """
         Translate text to target language using gpt-4.1-mini via Responses API
+        Runs on a caller-provided AsyncOpenAI client
         """
+        cache_key, result = self._cached_translation(text, target_language)
+        if result is not None:
+            return result
+        
         # Log translation start for debugging timeout issues
         start_time = time.time()
         try:
-            # Skip translation if target is English
-            if target_language.lower() == 'en':
-                return text
             logger.info(f"Starting translation to {target_language}")
             
-            # Prepare input for Responses API as simple text
-            input_content = f"Translate the following text into {target_language} only. Maintain the original formatting and meaning:\n\n{text}"
-            
             # Use gpt-4.1-mini via Responses API for translation
             # Note: gpt-4.1-mini doesn't support reasoning parameter
-            response = self.client.responses.create(
+            response = await aclient.responses.create(
                 model="gpt-4.1-mini",
-                input=input_content,
+                input=translation_prefix(target_language) + text,
                 max_output_tokens=2048
             )
             
-            # Log completion time
             duration = time.time() - start_time
             logger.info(f"Translation to {target_language} completed in {duration:.2f} seconds")
             
-            if response.status == "incomplete":
-                logger.warning(f"Translation incomplete: {response.incomplete_details}")
-                if response.output_text:
-                    return response.output_text
-                else:
-                    # Fallback to original text if translation fails
-                    logger.warning(f"Translation failed, returning original text")
-                    return text
-            
-            return response.output_text or text
+            return self._finish_translation(response, text, target_language, cache_key)
             
         except Exception as e:
-            try:
-                duration = time.time() - start_time
-            except NameError:
-                duration = 0
+            duration = time.time() - start_time
             logger.error(f"Translation API error for {target_language} after {duration:.2f}s: {str(e)}")
             # Return original text instead of raising error to prevent total failure
             logger.warning(f"Translation failed, returning original text for {target_language}")
             return text
     
-    def create_batch_file(self, requests: List[Dict[str, Any]]) -> str:
+    async def _translate_languages_async(self, text: str, languages: List[str],
+                                         timeout: Optional[float]) -> Dict[str, str]:
+        # The async client is bound to the running event loop, so it lives only for this fan-out
+        async with AsyncOpenAI(api_key=OPENAI_API_KEY, timeout=60.0, max_retries=2) as aclient:
+            # Bound in-flight requests to stay within OpenAI rate limits
+            semaphore = asyncio.Semaphore(TRANSLATION_CONCURRENCY)
+            
+            async def translate(lang: str) -> str:
+                async with semaphore:
+                    return await self.translate_text_async(aclient, text, lang)
+            
+            tasks = {
+                lang: asyncio.create_task(translate(lang))
+                for lang in dict.fromkeys(languages)
+            }
+            done, pending = await asyncio.wait(tasks.values(), timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            
+            return {lang: task.result() for lang, task in tasks.items() if task in done}
+    
+    def translate_languages(self, text: str, languages: List[str],
+                            timeout: Optional[float] = None) -> Dict[str, str]:
+        """
+        Translate one text into several languages concurrently
+        Returns {language: translation}; languages not finished within timeout are omitted
+        """
+        if not languages:
+            return {}
+        return asyncio.run(self._translate_languages_async(text, languages, timeout))
+    
+    def create_batch_file(self, requests: List[Dict[str, Any]]) -> bytes:
         """
-        Create JSONL file for batch processing
+        Create JSONL file content for batch processing
         """
-        jsonl_content = []
+        buf = io.BytesIO()
+        write = buf.write
         for req in requests:
-            jsonl_content.append(json.dumps(req, separators=(',', ':')))
+            write(orjson.dumps(req))
+            write(b"\n")
         
-        return '\n'.join(jsonl_content)
+        return buf.getvalue()
+    
+    def write_batch_file(self, requests: Iterable[Dict[str, Any]]) -> BinaryIO:
+        """
+        Write batch requests as JSONL into a spooled temp file, rewound for reading
+        Requests are consumed lazily, so a generator never has to be materialised
+        """
+        spool = tempfile.SpooledTemporaryFile(max_size=BATCH_SPOOL_MAX_BYTES)
+        write = spool.write
+        for req in requests:
+            write(orjson.dumps(req))
+            write(b"\n")
+        spool.seek(0)
+        return spool
+    
+    def submit_batch_requests(self, requests: Iterable[Dict[str, Any]], description: str) -> str:
+        """
+        Stream batch requests into a JSONL upload and submit them as one batch job
+        """
+        with self.write_batch_file(requests) as spool:
+            return self.submit_batch_job(spool, description)
+    
+    def translation_batch_request(self, custom_id: str, text: str, target_language: str) -> Dict[str, Any]:
+        """
+        Build one Batch API line translating text, same prompt as translate_text_async
+        """
+        return {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/responses",
+            "body": {
+                "model": "gpt-4.1-mini",
+                "input": translation_prefix(target_language) + text,
+                "max_output_tokens": 2048
+            }
+        }
+    
+    def submit_translation_batch(self, items: List[Tuple[str, str, str]], description: str) -> Optional[str]:
+        """
+        Submit (custom_id, text, target_language) translations as one Batch API job
+        Returns the OpenAI batch ID, or None if there was nothing to translate
+        """
+        if not items:
+            return None
+        return self.submit_batch_requests(
+            (self.translation_batch_request(custom_id, text, lang) for custom_id, text, lang in items),
+            description
+        )
     
-    def submit_batch_job(self, jsonl_content: str, description: str) -> str:
+    def submit_batch_job(self, jsonl_content: Union[bytes, BinaryIO], description: str) -> str:
         """
         Submit batch job to OpenAI with proper file handling
+        jsonl_content is either JSONL bytes or a binary file object positioned at its start
         """
         try:
             # Create file with proper filename parameter
-            import io
-            file_obj = io.BytesIO(jsonl_content.encode('utf-8'))
+            file_obj = io.BytesIO(jsonl_content) if isinstance(jsonl_content, bytes) else jsonl_content
             
             file_response = self.client.files.create(
                 file=(f"batch_{int(time.time())}.jsonl", file_obj, "application/jsonl"),
@@ -183,13 +407,23 @@ class OpenAIClient:
             logger.error(f"Batch status error: {str(e)}")
             raise e
     
-    def download_batch_results(self, file_id: str) -> str:
+    def iter_batch_result_lines(self, file_id: str) -> Iterator[str]:
         """
-        Download batch results file
+        Stream a batch results file, yielding its non-empty JSONL lines unparsed
         """
         try:
-            file_response = self.client.files.content(file_id)
-            return file_response.read().decode('utf-8')
+            with self.client.files.with_streaming_response.content(file_id) as response:
+                for line in response.iter_lines():
+                    if line.strip():
+                        yield line
         except Exception as e:
             logger.error(f"Batch download error: {str(e)}")
             raise e
+    
+    def iter_batch_results(self, file_id: str) -> Iterator[Dict[str, Any]]:
+        """
+        Stream a batch results file, yielding one parsed JSONL record at a time
+        without holding the whole file in memory
+        """
+        for line in self.iter_batch_result_lines(file_id):
+            yield orjson.loads(line)
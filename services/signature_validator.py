@@ -7,26 +7,39 @@ from config import SHARED_KEY
 
 logger = logging.getLogger(__name__)
 
+# Canonical signing form: compact separators, sorted keys, ASCII escapes.
+# Built once; json.dumps with non-default options creates a new encoder per call.
+CANONICAL_JSON = json.JSONEncoder(separators=(',', ':'), sort_keys=True)
+
 class SignatureValidator:
     def __init__(self):
         self.shared_key = SHARED_KEY
+        # Keyed HMAC state, copied per signature so key setup happens once
+        self._prf = hmac.new(self.shared_key.encode(), None, hashlib.sha256)
+    
+    def canonicalize(self, lots: List[Dict[str, Any]]) -> bytes:
+        """
+        Canonical signing bytes for lots data (no spaces, sorted keys, ASCII)
+        """
+        return CANONICAL_JSON.encode(lots).encode('ascii')
+    
+    def sign_canonical(self, canonical: bytes) -> str:
+        """
+        HMAC-SHA256 hex signature of already-canonicalized bytes
+        """
+        return self._digest(canonical).hex()
+    
+    def _digest(self, canonical: bytes) -> bytes:
+        mac = self._prf.copy()
+        mac.update(canonical)
+        return mac.digest()
     
     def generate_signature(self, lots: List[Dict[str, Any]]) -> str:
         """
         Generate HMAC-SHA256 signature for lots data
         """
         try:
-            # Normalize JSON (no spaces, sorted keys)
-            normalized = json.dumps(lots, separators=(',', ':'), sort_keys=True)
-            
-            # Generate HMAC-SHA256
-            signature = hmac.new(
-                self.shared_key.encode(),
-                normalized.encode(),
-                hashlib.sha256
-            ).hexdigest()
-            
-            return signature
+            return self.sign_canonical(self.canonicalize(lots))
             
         except Exception as e:
             logger.error(f"Signature generation error: {str(e)}")
@@ -37,10 +50,16 @@ class SignatureValidator:
         Validate provided signature against lots data
         """
         try:
-            expected_signature = self.generate_signature(lots)
+            provided_digest = bytes.fromhex(provided_signature)
+        except (TypeError, ValueError):
+            # Not a hex string, can't match
+            return False
+        
+        try:
+            expected_digest = self._digest(self.canonicalize(lots))
             
-            # Use constant-time comparison to prevent timing attacks
-            return hmac.compare_digest(expected_signature, provided_signature)
+            # Use constant-time comparison on the raw digests to prevent timing attacks
+            return hmac.compare_digest(expected_digest, provided_digest)
             
         except Exception as e:
             logger.error(f"Signature validation error: {str(e)}")
@@ -1,56 +1,133 @@
-import json
+import asyncio
+import gzip
+import hashlib
 import logging
-import time
-import requests
-from typing import List, Dict, Any
+import random
+import threading
+import httpx
+from concurrent.futures import Future
+from typing import List, Dict, Any, Tuple
 from services.signature_validator import SignatureValidator
-from utils.retry import exponential_backoff
-from config import WEBHOOK_RETRY_ATTEMPTS, WEBHOOK_BASE_DELAY
+from config import WEBHOOK_RETRY_ATTEMPTS, WEBHOOK_BASE_DELAY, WEBHOOK_SEND_CONCURRENCY, WEBHOOK_GZIP_THRESHOLD
 
 logger = logging.getLogger(__name__)
 
+# Base delay before each retry (seconds), jittered ±20% when used
+WEBHOOK_RETRY_DELAYS = tuple(WEBHOOK_BASE_DELAY * (2 ** i) for i in range(WEBHOOK_RETRY_ATTEMPTS - 1))
+
+def _retry_delay(attempt: int) -> float:
+    # Jitter decorrelates retry waves across subscribers
+    return WEBHOOK_RETRY_DELAYS[attempt] * random.uniform(0.8, 1.2)
+
+def compress_webhook_body(body: bytes) -> Tuple[bytes, Dict[str, str]]:
+    """
+    Gzip a webhook body above WEBHOOK_GZIP_THRESHOLD
+    Returns (body, extra_headers)
+    """
+    if WEBHOOK_GZIP_THRESHOLD and len(body) > WEBHOOK_GZIP_THRESHOLD:
+        # Level 1 keeps most of the ratio on JSON at a fraction of the CPU
+        return gzip.compress(body, compresslevel=1), {'Content-Encoding': 'gzip'}
+    return body, {}
+
+WEBHOOK_HEADERS = {
+    'Content-Type': 'application/json',
+    'User-Agent': 'Generation-Service/1.0.0'
+}
+
+# Sends still in flight across all broadcasts (each runs on its own event loop),
+# so a thread-safe Future rather than an asyncio one
+_inflight: Dict[bytes, Future] = {}
+_inflight_lock = threading.Lock()
+
 class WebhookHandler:
     def __init__(self):
         self.signature_validator = SignatureValidator()
-        self.session = requests.Session()
-        self.session.headers.update({
-            'Content-Type': 'application/json',
-            'User-Agent': 'Generation-Service/1.0.0'
-        })
     
     def send_webhook(self, webhook_url: str, lots_data: List[Dict[str, Any]]):
         """
         Send webhook with retry logic
         """
+        self.send_webhooks({webhook_url: lots_data})
+    
+    def _build_body(self, lots_data: List[Dict[str, Any]]) -> Tuple[bytes, str]:
+        """
+        Serialize lots once and reuse the canonical bytes for both the HMAC and the body
+        Returns (body, signature)
+        """
+        lots_bytes = self.signature_validator.canonicalize(lots_data)
+        signature = self.signature_validator.sign_canonical(lots_bytes)
+        body = b"".join((
+            b'{"version":"1.0.0","lots":', lots_bytes,
+            b',"signature":"', signature.encode('ascii'), b'"}'
+        ))
+        return body, signature
+    
+    def send_webhooks(self, webhook_groups: Dict[str, List[Dict[str, Any]]]):
+        """
+        Send one webhook per URL concurrently, each with its own retry schedule
+        """
+        if not webhook_groups:
+            return
+        asyncio.run(self._broadcast(webhook_groups))
+    
+    async def _broadcast(self, webhook_groups: Dict[str, List[Dict[str, Any]]]):
+        # One client per broadcast: an AsyncClient's pool is tied to the event loop
+        async with httpx.AsyncClient(
+            http2=True,
+            timeout=30,
+            limits=httpx.Limits(max_connections=WEBHOOK_SEND_CONCURRENCY),
+            headers=WEBHOOK_HEADERS
+        ) as client:
+            await asyncio.gather(*(
+                self.asend_webhook(client, webhook_url, lots_data)
+                for webhook_url, lots_data in webhook_groups.items()
+            ))
+    
+    async def asend_webhook(self, client: httpx.AsyncClient, webhook_url: str, lots_data: List[Dict[str, Any]]):
+        """
+        Send one webhook with retry logic on a caller-provided client
+        A send identical to one still in flight (same URL and lots) waits for it instead of posting again
+        """
         try:
-            # Prepare webhook payload
-            payload = {
-                "version": "1.0.0",
-                "lots": lots_data
-            }
+            body, signature = self._build_body(lots_data)
             
-            # Generate signature
-            payload["signature"] = self.signature_validator.generate_signature(lots_data)
-            
-            # Send with retry logic
-            self._send_with_retry(webhook_url, payload)
+        except Exception as e:
+            logger.error(f"Webhook sending failed for {webhook_url}: {str(e)}")
+            return
+        
+        # The signature covers the lots, so URL + signature identifies the delivery
+        key = hashlib.blake2b((webhook_url + signature).encode(), digest_size=16).digest()
+        with _inflight_lock:
+            inflight = _inflight.get(key)
+            if inflight is None:
+                _inflight[key] = future = Future()
+        
+        if inflight is not None:
+            logger.info(f"Webhook to {webhook_url} already in flight, waiting for it")
+            await asyncio.wrap_future(inflight)
+            return
+        
+        try:
+            await self._asend_with_retry(client, webhook_url, body)
             
         except Exception as e:
             logger.error(f"Webhook sending failed for {webhook_url}: {str(e)}")
+        
+        finally:
+            with _inflight_lock:
+                del _inflight[key]
+            future.set_result(None)
     
-    def _send_with_retry(self, webhook_url: str, payload: Dict[str, Any]):
+    async def _asend_with_retry(self, client: httpx.AsyncClient, webhook_url: str, body: bytes):
         """
-        Send webhook with exponential backoff retry
+        Send webhook with exponential backoff retry; backoff waits don't hold a thread
         """
         last_exception = None
+        body, headers = compress_webhook_body(body)
         
         for attempt in range(WEBHOOK_RETRY_ATTEMPTS):
             try:
-                response = self.session.post(
-                    webhook_url,
-                    json=payload,
-                    timeout=30
-                )
+                response = await client.post(webhook_url, content=body, headers=headers)
                 
                 if 200 <= response.status_code < 300:
                     logger.info(f"Webhook sent successfully to {webhook_url} on attempt {attempt + 1}")
@@ -59,15 +136,15 @@ class WebhookHandler:
                     logger.warning(f"Webhook failed with status {response.status_code} for {webhook_url}")
                     last_exception = Exception(f"HTTP {response.status_code}")
             
-            except requests.exceptions.RequestException as e:
+            except httpx.HTTPError as e:
                 logger.warning(f"Webhook attempt {attempt + 1} failed for {webhook_url}: {str(e)}")
                 last_exception = e
             
             # Calculate delay for next attempt
             if attempt < WEBHOOK_RETRY_ATTEMPTS - 1:
-                delay = exponential_backoff(attempt, WEBHOOK_BASE_DELAY)
-                logger.info(f"Retrying webhook in {delay} seconds")
-                time.sleep(delay)
+                delay = _retry_delay(attempt)
+                logger.info(f"Retrying webhook in {delay:.2f} seconds")
+                await asyncio.sleep(delay)
         
         # All retries failed
         logger.error(f"All webhook retry attempts failed for {webhook_url}. Last error: {str(last_exception)}")
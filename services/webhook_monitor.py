@@ -6,11 +6,18 @@ Provides real-time monitoring and metrics for webhook delivery system
 import logging
 from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional
-from sqlalchemy import func, and_, or_
+from sqlalchemy import func, and_, or_, case
 from database.models import WebhookDelivery, BatchJob
+from config import WEBHOOK_METRICS_CACHE_TTL, WEBHOOK_MAX_ATTEMPTS
+from utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# Shared across requests (a WebhookMonitor is created per request); only
+# successful results are stored so errors are retried on the next call.
+# Values are flat dicts/lists of dicts, handed out as copies so callers can't alter them
+_metrics_cache = TTLCache(maxsize=32, ttl=WEBHOOK_METRICS_CACHE_TTL)
+
 class WebhookMonitor:
     """
     Monitor webhook delivery system health and performance
@@ -23,70 +30,54 @@ class WebhookMonitor:
         """
         Get webhook delivery metrics for the specified time period
         """
+        cache_key = ('delivery_metrics', hours)
+        cached = _metrics_cache.get(cache_key)
+        if cached is not None:
+            return dict(cached)
+        
+        # One clock reading for the window cutoff and the reported timestamp
+        now = datetime.utcnow()
         try:
-            since = datetime.utcnow() - timedelta(hours=hours)
+            since = now - timedelta(hours=hours)
             
-            # Total deliveries
-            total = self.session.query(func.count(WebhookDelivery.id)).filter(
-                WebhookDelivery.created_at >= since
-            ).scalar() or 0
-            
-            # Successful deliveries
-            delivered = self.session.query(func.count(WebhookDelivery.id)).filter(
-                and_(
-                    WebhookDelivery.created_at >= since,
-                    WebhookDelivery.status == 'delivered'
-                )
-            ).scalar() or 0
+            in_window = WebhookDelivery.created_at >= since
+            is_delivered = and_(in_window, WebhookDelivery.status == 'delivered')
+            # Pending is a backlog figure, so it is not limited to the time window
+            is_pending = and_(
+                WebhookDelivery.status.in_(['pending', 'failed']),
+                WebhookDelivery.attempt_count < WEBHOOK_MAX_ATTEMPTS
+            )
             
-            # Failed deliveries
-            failed = self.session.query(func.count(WebhookDelivery.id)).filter(
-                and_(
-                    WebhookDelivery.created_at >= since,
+            # All counters and averages in one scan
+            row = self.session.query(
+                func.count(case((in_window, 1))).label('total'),
+                func.count(case((is_delivered, 1))).label('delivered'),
+                func.count(case((and_(
+                    in_window,
                     WebhookDelivery.status == 'failed',
-                    WebhookDelivery.attempt_count >= 5
-                )
-            ).scalar() or 0
+                    WebhookDelivery.attempt_count >= WEBHOOK_MAX_ATTEMPTS
+                ), 1))).label('failed'),
+                func.count(case((is_pending, 1))).label('pending'),
+                func.avg(case((is_delivered, WebhookDelivery.attempt_count))).label('avg_retries'),
+                func.avg(case((
+                    and_(is_delivered, WebhookDelivery.delivered_at.isnot(None)),
+                    func.extract('epoch', WebhookDelivery.delivered_at - WebhookDelivery.created_at)
+                ))).label('avg_delivery_time')
+            ).filter(
+                or_(in_window, is_pending)
+            ).one()
             
-            # Pending deliveries
-            pending = self.session.query(func.count(WebhookDelivery.id)).filter(
-                and_(
-                    WebhookDelivery.status.in_(['pending', 'failed']),
-                    WebhookDelivery.attempt_count < 5
-                )
-            ).scalar() or 0
-            
-            # Average retry count for successful deliveries
-            avg_retries = self.session.query(func.avg(WebhookDelivery.attempt_count)).filter(
-                and_(
-                    WebhookDelivery.created_at >= since,
-                    WebhookDelivery.status == 'delivered'
-                )
-            ).scalar() or 0
-            
-            # Average delivery time (for successful deliveries)
-            successful_deliveries = self.session.query(WebhookDelivery).filter(
-                and_(
-                    WebhookDelivery.created_at >= since,
-                    WebhookDelivery.status == 'delivered',
-                    WebhookDelivery.delivered_at.isnot(None)
-                )
-            ).all()
-            
-            if successful_deliveries:
-                delivery_times = [
-                    (d.delivered_at - d.created_at).total_seconds()
-                    for d in successful_deliveries
-                    if d.delivered_at
-                ]
-                avg_delivery_time = sum(delivery_times) / len(delivery_times) if delivery_times else 0
-            else:
-                avg_delivery_time = 0
+            total = row.total or 0
+            delivered = row.delivered or 0
+            failed = row.failed or 0
+            pending = row.pending or 0
+            avg_retries = row.avg_retries or 0
+            avg_delivery_time = float(row.avg_delivery_time or 0)
             
             # Calculate success rate
             success_rate = (delivered / total * 100) if total > 0 else 0
             
-            return {
+            metrics = {
                 'period_hours': hours,
                 'total_webhooks': total,
                 'delivered': delivered,
@@ -95,14 +86,16 @@ class WebhookMonitor:
                 'success_rate': round(success_rate, 2),
                 'average_retries': round(float(avg_retries), 2),
                 'average_delivery_time_seconds': round(avg_delivery_time, 2),
-                'metrics_timestamp': datetime.utcnow().isoformat()
+                'metrics_timestamp': now.isoformat()
             }
+            _metrics_cache.set(cache_key, metrics)
+            return dict(metrics)
             
         except Exception as e:
-            logger.error(f"Error calculating webhook metrics: {str(e)}")
+            logger.error("Error calculating webhook metrics: %s", e)
             return {
                 'error': str(e),
-                'metrics_timestamp': datetime.utcnow().isoformat()
+                'metrics_timestamp': now.isoformat()
             }
     
     def get_failed_webhooks(self, limit: int = 10) -> List[Dict[str, Any]]:
@@ -110,10 +103,18 @@ class WebhookMonitor:
         Get recently failed webhook deliveries
         """
         try:
-            failed_webhooks = self.session.query(WebhookDelivery).filter(
+            # Only the reported columns; skips the payload JSON and ORM hydration
+            failed_webhooks = self.session.query(
+                WebhookDelivery.id,
+                WebhookDelivery.webhook_url,
+                WebhookDelivery.attempt_count,
+                WebhookDelivery.error_message,
+                WebhookDelivery.last_attempt_at,
+                WebhookDelivery.created_at
+            ).filter(
                 and_(
                     WebhookDelivery.status == 'failed',
-                    WebhookDelivery.attempt_count >= 5
+                    WebhookDelivery.attempt_count >= WEBHOOK_MAX_ATTEMPTS
                 )
             ).order_by(WebhookDelivery.last_attempt_at.desc()).limit(limit).all()
             
@@ -130,58 +131,80 @@ class WebhookMonitor:
             ]
             
         except Exception as e:
-            logger.error(f"Error getting failed webhooks: {str(e)}")
+            logger.error("Error getting failed webhooks: %s", e)
             return []
     
-    def get_webhook_endpoint_health(self) -> List[Dict[str, Any]]:
+    def get_webhook_endpoint_health(self, limit: Optional[int] = None,
+                                    min_attempts: int = 0) -> List[Dict[str, Any]]:
         """
-        Get health metrics per webhook endpoint
+        Get health metrics per webhook endpoint, worst success rate first
+        
+        Endpoints with fewer than min_attempts deliveries are skipped and at
+        most limit endpoints are returned; both are applied in SQL
         """
+        cache_key = ('endpoint_health', limit, min_attempts)
+        cached = _metrics_cache.get(cache_key)
+        if cached is not None:
+            return [dict(endpoint) for endpoint in cached]
+        
         try:
             # Group by webhook URL to get endpoint-specific metrics
-            from sqlalchemy import Integer
-            endpoint_stats = self.session.query(
+            total = func.count(WebhookDelivery.id)
+            delivered = func.count(case((WebhookDelivery.status == 'delivered', 1)))
+            success_rate = delivered * 100.0 / total
+            
+            query = self.session.query(
                 WebhookDelivery.webhook_url,
-                func.count(WebhookDelivery.id).label('total'),
-                func.sum(func.cast(WebhookDelivery.status == 'delivered', Integer)).label('delivered'),
-                func.sum(func.cast(and_(
+                total.label('total'),
+                delivered.label('delivered'),
+                func.count(case((and_(
                     WebhookDelivery.status == 'failed',
-                    WebhookDelivery.attempt_count >= 5
-                ), Integer)).label('failed')
-            ).group_by(WebhookDelivery.webhook_url).all()
+                    WebhookDelivery.attempt_count >= WEBHOOK_MAX_ATTEMPTS
+                ), 1))).label('failed')
+            ).group_by(WebhookDelivery.webhook_url)
+            
+            if min_attempts > 0:
+                query = query.having(total >= min_attempts)
+            
+            # Problematic endpoints first
+            query = query.order_by(success_rate.asc())
+            if limit is not None:
+                query = query.limit(limit)
             
             results = []
-            for url, total, delivered, failed in endpoint_stats:
-                delivered = delivered or 0
-                failed = failed or 0
-                success_rate = (delivered / total * 100) if total > 0 else 0
+            for url, total_count, delivered_count, failed_count in query.all():
+                rate = (delivered_count / total_count * 100) if total_count > 0 else 0
                 
                 results.append({
                     'webhook_url': url,
-                    'total_attempts': total,
-                    'successful': delivered,
-                    'failed': failed,
-                    'success_rate': round(success_rate, 2)
+                    'total_attempts': total_count,
+                    'successful': delivered_count,
+                    'failed': failed_count,
+                    'success_rate': round(rate, 2)
                 })
             
-            # Sort by success rate (ascending to show problematic endpoints first)
-            results.sort(key=lambda x: x['success_rate'])
-            
-            return results
+            _metrics_cache.set(cache_key, results)
+            return [dict(endpoint) for endpoint in results]
             
         except Exception as e:
-            logger.error(f"Error getting webhook endpoint health: {str(e)}")
+            logger.error("Error getting webhook endpoint health: %s", e)
             return []
     
-    def check_alerts(self) -> List[Dict[str, Any]]:
+    def check_alerts(self, metrics_1h: Optional[Dict[str, Any]] = None,
+                     endpoint_health: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
         """
         Check for conditions that should trigger alerts
+        
+        metrics_1h and endpoint_health can be passed in by callers that
+        already computed them; not cached itself since both inputs are
         """
+        now = datetime.utcnow()
         alerts = []
         
         try:
             # Check success rate in last hour
-            metrics_1h = self.get_delivery_metrics(hours=1)
+            if metrics_1h is None:
+                metrics_1h = self.get_delivery_metrics(hours=1)
             if metrics_1h.get('total_webhooks', 0) > 10:  # Only alert if sufficient volume
                 if metrics_1h.get('success_rate', 100) < 90:
                     alerts.append({
@@ -192,14 +215,15 @@ class WebhookMonitor:
                     })
             
             # Check for stuck pending webhooks
-            old_pending = self.session.query(func.count(WebhookDelivery.id)).filter(
-                and_(
-                    WebhookDelivery.status == 'pending',
-                    WebhookDelivery.created_at < datetime.utcnow() - timedelta(hours=1)
-                )
-            ).scalar() or 0
+            stuck = and_(
+                WebhookDelivery.status == 'pending',
+                WebhookDelivery.created_at < now - timedelta(hours=1)
+            )
+            # Probe for the threshold with LIMIT; the exact count is only needed for the alert text
+            old_pending = len(self.session.query(WebhookDelivery.id).filter(stuck).limit(11).all())
             
             if old_pending > 10:
+                old_pending = self.session.query(func.count(WebhookDelivery.id)).filter(stuck).scalar() or 0
                 alerts.append({
                     'level': 'error',
                     'message': f"{old_pending} webhooks have been pending for over 1 hour",
@@ -217,7 +241,8 @@ class WebhookMonitor:
                 })
             
             # Check for endpoints with consistent failures
-            endpoint_health = self.get_webhook_endpoint_health()
+            if endpoint_health is None:
+                endpoint_health = self.get_webhook_endpoint_health(limit=3)
             for endpoint in endpoint_health[:3]:  # Check top 3 worst performing
                 if endpoint['total_attempts'] > 5 and endpoint['success_rate'] < 50:
                     alerts.append({
@@ -229,7 +254,7 @@ class WebhookMonitor:
                     })
             
         except Exception as e:
-            logger.error(f"Error checking alerts: {str(e)}")
+            logger.error("Error checking alerts: %s", e)
             alerts.append({
                 'level': 'error',
                 'message': f"Error checking webhook alerts: {str(e)}",
@@ -242,14 +267,17 @@ class WebhookMonitor:
         """
         Get comprehensive webhook system summary report
         """
+        now = datetime.utcnow()
         try:
+            metrics_1h = self.get_delivery_metrics(hours=1)
+            endpoint_health = self.get_webhook_endpoint_health(limit=10)
             report = {
                 'metrics_24h': self.get_delivery_metrics(hours=24),
-                'metrics_1h': self.get_delivery_metrics(hours=1),
+                'metrics_1h': metrics_1h,
                 'failed_webhooks': self.get_failed_webhooks(limit=5),
-                'endpoint_health': self.get_webhook_endpoint_health()[:10],
-                'alerts': self.check_alerts(),
-                'report_timestamp': datetime.utcnow().isoformat()
+                'endpoint_health': endpoint_health,
+                'alerts': self.check_alerts(metrics_1h, endpoint_health),
+                'report_timestamp': now.isoformat()
             }
             
             # Add overall health score (0-100)
@@ -276,10 +304,10 @@ class WebhookMonitor:
             return report
             
         except Exception as e:
-            logger.error(f"Error generating summary report: {str(e)}")
+            logger.error("Error generating summary report: %s", e)
             return {
                 'error': str(e),
-                'report_timestamp': datetime.utcnow().isoformat()
+                'report_timestamp': now.isoformat()
             }
     
     def _get_health_status(self, score: float) -> str:
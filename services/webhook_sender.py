@@ -1,15 +1,50 @@
+import asyncio
+import atexit
 import logging
 import hashlib
 import hmac
-import json
-import requests
-from typing import Dict, Any, List, Optional
+import httpx
+import orjson
+import random
+import time
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime, timedelta
 from urllib.parse import urlparse
-from config import SHARED_KEY, WEBHOOK_RETRY_ATTEMPTS
+from sqlalchemy import update
+from config import (
+    SHARED_KEY, WEBHOOK_RETRY_BACKOFF, WEBHOOK_MAX_ATTEMPTS, WEBHOOK_DELIVERY_CONCURRENCY,
+    WEBHOOK_HOST_CONCURRENCY, WEBHOOK_BREAKER_THRESHOLD, WEBHOOK_BREAKER_COOLDOWN
+)
 
 logger = logging.getLogger(__name__)
 
+WEBHOOK_CONNECT_TIMEOUT = 5
+WEBHOOK_READ_TIMEOUT = 10
+WEBHOOK_USER_AGENT = 'Generation-Service-Webhook/1.0'
+
+DeliveryOutcome = Tuple[str, Optional[int], Optional[str], Optional[str]]
+
+# Shared by the sync client and the per-pass AsyncClient so both post identically
+_CLIENT_OPTIONS: Dict[str, Any] = {
+    'http2': True,
+    'timeout': httpx.Timeout(WEBHOOK_READ_TIMEOUT, connect=WEBHOOK_CONNECT_TIMEOUT),
+    'limits': httpx.Limits(max_connections=WEBHOOK_DELIVERY_CONCURRENCY),
+    'follow_redirects': False,
+    'headers': {'Content-Type': 'application/json', 'User-Agent': WEBHOOK_USER_AGENT}
+}
+
+# One pooled client for single deliveries from every WebhookSender (httpx.Client is
+# thread-safe); the module owns it and closes it once at exit
+_http = httpx.Client(**_CLIENT_OPTIONS)
+atexit.register(_http.close)
+
+def canonical_body(payload: Dict[str, Any]) -> bytes:
+    """
+    Wire bytes for a webhook payload; the X-Signature HMAC is computed over
+    exactly these bytes
+    """
+    return orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+
 def is_safe_webhook_url(url: str) -> bool:
     """
     Validate webhook URL for security (prevent SSRF attacks)
@@ -20,12 +55,12 @@ def is_safe_webhook_url(url: str) -> bool:
         
         # Check scheme
         if parsed.scheme not in ['http', 'https']:
-            logger.warning(f"Invalid webhook URL scheme: {parsed.scheme}")
+            logger.warning("Invalid webhook URL scheme: %s", parsed.scheme)
             return False
         
         # Check hostname exists
         if not parsed.hostname:
-            logger.warning(f"No hostname in webhook URL: {url}")
+            logger.warning("No hostname in webhook URL: %s", url)
             return False
         
         # Block localhost and internal IPs
@@ -36,12 +71,12 @@ def is_safe_webhook_url(url: str) -> bool:
         ]
         
         if hostname in blocked_hosts:
-            logger.warning(f"Webhook URL points to localhost: {hostname}")
+            logger.warning("Webhook URL points to localhost: %s", hostname)
             return False
         
         # Block internal IP ranges (10.x.x.x, 172.16-31.x.x, 192.168.x.x)
         if hostname.startswith('10.') or hostname.startswith('192.168.'):
-            logger.warning(f"Webhook URL points to internal network: {hostname}")
+            logger.warning("Webhook URL points to internal network: %s", hostname)
             return False
         
         if hostname.startswith('172.'):
@@ -49,27 +84,30 @@ def is_safe_webhook_url(url: str) -> bool:
             if len(octets) >= 2:
                 second_octet = int(octets[1])
                 if 16 <= second_octet <= 31:
-                    logger.warning(f"Webhook URL points to internal network: {hostname}")
+                    logger.warning("Webhook URL points to internal network: %s", hostname)
                     return False
         
         # Block cloud metadata endpoints
         if hostname in ['169.254.169.254', 'metadata.google.internal']:
-            logger.warning(f"Webhook URL points to metadata endpoint: {hostname}")
+            logger.warning("Webhook URL points to metadata endpoint: %s", hostname)
             return False
         
         return True
         
     except Exception as e:
-        logger.error(f"Error validating webhook URL {url}: {str(e)}")
+        logger.error("Error validating webhook URL %s: %s", url, e)
         return False
 
 class WebhookSender:
     def __init__(self, db_session):
         self.session = db_session
         self.shared_key = SHARED_KEY
-        self.max_retries = WEBHOOK_RETRY_ATTEMPTS
-        # Unified retry delays: 0s, 30s, 60s, 120s, 300s
-        self.retry_delays = [0, 30, 60, 120, 300]
+        # Keyed once here; _generate_signature works on copies
+        self._prf = hmac.new(self.shared_key.encode(), None, hashlib.sha256)
+        # Same schedule as DatabaseManager.finalize_webhook and the pending filters
+        self.max_retries = WEBHOOK_MAX_ATTEMPTS
+        # Per-host circuit breaker: host -> (consecutive failures, monotonic open-until)
+        self._breaker: Dict[str, Tuple[int, float]] = {}
     
     def send_completion_webhook(self, job_id: str) -> bool:
         """Send webhook notification for completed job"""
@@ -92,17 +130,18 @@ class WebhookSender:
                 "result_url": f"/api/v1/batch-results/{job_id}"
             }
             
-            # Generate HMAC signature
-            signature = self._generate_signature(payload)
+            # Serialize once: the same bytes are signed and sent
+            body = canonical_body(payload)
+            signature = self._generate_signature(body)
             
             # Create webhook delivery record
             delivery_id = self._create_delivery_record(job_id, job.webhook_url, payload, signature)
             
             # Attempt delivery
-            return self._attempt_delivery(delivery_id)
+            return self._attempt_delivery(delivery_id, job.webhook_url, body, signature)
             
         except Exception as e:
-            logger.error(f"Error sending completion webhook for job {job_id}: {str(e)}")
+            logger.error("Error sending completion webhook for job %s: %s", job_id, e)
             return False
     
     def process_pending_deliveries(self):
@@ -111,19 +150,81 @@ class WebhookSender:
             # Import here to avoid circular imports
             from database.models import WebhookDelivery
             
-            pending_deliveries = self.session.query(WebhookDelivery).filter(
+            now = datetime.utcnow()
+            pending_deliveries = self.session.query(
+                WebhookDelivery.id,
+                WebhookDelivery.attempt_count,
+                WebhookDelivery.webhook_url,
+                WebhookDelivery.payload,
+                WebhookDelivery.signature
+            ).filter(
                 WebhookDelivery.status.in_(['pending', 'failed']),
-                WebhookDelivery.attempt_count < 5,
-                WebhookDelivery.next_attempt_at <= datetime.utcnow()
+                WebhookDelivery.attempt_count < WEBHOOK_MAX_ATTEMPTS,
+                WebhookDelivery.next_attempt_at <= now
             ).all()
             
-            logger.debug(f"Processing {len(pending_deliveries)} pending webhook deliveries")
+            logger.debug("Processing %s pending webhook deliveries", len(pending_deliveries))
+            if not pending_deliveries:
+                return
+            
+            # HTTP fans out on one event loop; status updates stay on this thread's DB session
+            outcomes = asyncio.run(self._post_deliveries_async(pending_deliveries))
             
-            for delivery in pending_deliveries:
-                self._attempt_delivery(str(delivery.id))
+            # One executemany UPDATE by primary key and a single commit for the whole pass
+            self.session.execute(
+                update(WebhookDelivery),
+                [self._delivery_update(delivery, outcome, now)
+                 for delivery, outcome in zip(pending_deliveries, outcomes)]
+            )
+            self.session.commit()
                 
         except Exception as e:
-            logger.error(f"Error processing pending webhook deliveries: {str(e)}")
+            self.session.rollback()
+            logger.error("Error processing pending webhook deliveries: %s", e)
+    
+    def _retry_delay(self, attempt_count: int) -> float:
+        """
+        Seconds until the retry after attempt_count attempts, with ±20% jitter so
+        deliveries that failed together (e.g. a receiver outage) don't retry in lockstep
+        """
+        base = WEBHOOK_RETRY_BACKOFF[min(attempt_count - 1, len(WEBHOOK_RETRY_BACKOFF) - 1)]
+        return base * random.uniform(0.8, 1.2)
+    
+    def _delivery_update(self, delivery, outcome: DeliveryOutcome,
+                         now: datetime) -> Dict[str, Any]:
+        """
+        Row mapping for a bulk UPDATE; same rules as _update_delivery_status,
+        using the attempt_count read with the pending row
+        """
+        status, response_status, response_body, error_message = outcome
+        if status == 'skipped':
+            # Not an attempt: only push the retry past the open circuit
+            return {
+                'id': delivery.id,
+                'next_attempt_at': now + timedelta(seconds=self._breaker_remaining(delivery.webhook_url))
+            }
+        
+        attempt_count = delivery.attempt_count + 1
+        values: Dict[str, Any] = {
+            'id': delivery.id,
+            'status': status,
+            'attempt_count': attempt_count,
+            'last_attempt_at': now
+        }
+        
+        if status == 'delivered':
+            values['delivered_at'] = now
+        elif attempt_count < self.max_retries:
+            values['next_attempt_at'] = now + timedelta(seconds=self._retry_delay(attempt_count))
+        
+        if response_status is not None:
+            values['response_status'] = response_status
+        if response_body:
+            values['response_body'] = response_body[:1000]
+        if error_message:
+            values['error_message'] = error_message[:500]
+        
+        return values
     
     def _create_delivery_record(self, job_id: str, webhook_url: str, payload: Dict[str, Any], signature: str) -> str:
         """Create webhook delivery record in database"""
@@ -141,174 +242,218 @@ class WebhookSender:
             )
             
             self.session.add(delivery)
+            # Read the generated id before commit expires the instance (avoids a reload SELECT)
+            self.session.flush()
+            delivery_id = str(delivery.id)
             self.session.commit()
             
-            return str(delivery.id)
+            return delivery_id
             
         except Exception as e:
             self.session.rollback()
-            logger.error(f"Error creating webhook delivery record: {str(e)}")
+            logger.error("Error creating webhook delivery record: %s", e)
             raise e
     
-    def _attempt_delivery(self, delivery_id: str) -> bool:
-        """Attempt webhook delivery"""
-        try:
-            # Import here to avoid circular imports
-            from database.models import WebhookDelivery
-            
-            delivery = self.session.query(WebhookDelivery).filter(
-                WebhookDelivery.id == delivery_id
-            ).first()
-            
-            if not delivery:
-                return False
-            
-            # Validate webhook URL for security
-            if not is_safe_webhook_url(delivery.webhook_url):
-                self._update_delivery_status(
-                    delivery_id, 'failed',
-                    error_message="Invalid or unsafe webhook URL"
-                )
-                logger.error(f"Webhook URL failed security validation: {delivery.webhook_url}")
-                return False
-            
-            # Prepare headers
-            headers = {
-                'Content-Type': 'application/json',
-                'X-Signature': delivery.signature,
-                'User-Agent': 'Generation-Service-Webhook/1.0'
-            }
-            
-            # Make HTTP request
-            response = requests.post(
-                delivery.webhook_url,
-                json=delivery.payload,
-                headers=headers,
-                timeout=10,
-                allow_redirects=False
-            )
-            
-            # Update delivery status based on response
-            if 200 <= response.status_code < 300:
-                self._update_delivery_status(
-                    delivery_id, 'delivered', 
-                    response.status_code, response.text[:1000]
-                )
-                logger.info(f"Webhook delivered successfully: {delivery_id}")
-                return True
-            else:
-                self._update_delivery_status(
-                    delivery_id, 'failed',
-                    response.status_code, response.text[:1000],
-                    f"HTTP {response.status_code}"
-                )
-                logger.warning(f"Webhook delivery failed with HTTP {response.status_code}: {delivery_id}")
-                return False
-                
-        except requests.exceptions.Timeout:
-            self._update_delivery_status(delivery_id, 'failed', None, None, "Request timeout")
-            logger.warning(f"Webhook delivery timeout: {delivery_id}")
-            return False
-            
-        except requests.exceptions.ConnectionError:
-            self._update_delivery_status(delivery_id, 'failed', None, None, "Connection error")
-            logger.warning(f"Webhook delivery connection error: {delivery_id}")
+    def _attempt_delivery(self, delivery_id: str, webhook_url: str, body: bytes, signature: str) -> bool:
+        """Make the first delivery attempt for a freshly created record"""
+        if self._breaker_check(webhook_url):
+            # Left due; the next pending pass reschedules it past the cool-down
             return False
+        
+        outcome = self._post_delivery(delivery_id, webhook_url, body, signature)
+        self._breaker_record(webhook_url, outcome)
+        self._update_delivery_status(delivery_id, 1, *outcome)
+        return outcome[0] == 'delivered'
+    
+    def _breaker_remaining(self, webhook_url: str) -> float:
+        """Seconds until the circuit for this URL's host closes again (0 when closed)"""
+        _, open_until = self._breaker.get(urlparse(webhook_url).netloc, (0, 0.0))
+        return max(0.0, open_until - time.monotonic())
+    
+    def _breaker_check(self, webhook_url: str) -> Optional[DeliveryOutcome]:
+        """
+        Return a 'skipped' outcome while the host's circuit is open, else None
+        """
+        if self._breaker_remaining(webhook_url) > 0:
+            logger.debug("Circuit open for %s, skipping delivery", urlparse(webhook_url).netloc)
+            return 'skipped', None, None, None
+        return None
+    
+    def _breaker_record(self, webhook_url: str, outcome: DeliveryOutcome):
+        """
+        Track consecutive transport/5xx failures per host; open the circuit for
+        WEBHOOK_BREAKER_COOLDOWN seconds once WEBHOOK_BREAKER_THRESHOLD is reached
+        """
+        host = urlparse(webhook_url).netloc
+        status, response_status = outcome[0], outcome[1]
+        if status == 'delivered' or (response_status is not None and response_status < 500):
+            # The host answered; a 4xx is the receiver's verdict, not an outage
+            self._breaker.pop(host, None)
+            return
+        
+        failures, open_until = self._breaker.get(host, (0, 0.0))
+        failures += 1
+        if failures >= WEBHOOK_BREAKER_THRESHOLD:
+            now = time.monotonic()
+            if open_until <= now:
+                # Other posts of the same wave may fail after the circuit opened; log it once
+                logger.warning("Opening webhook circuit for %s after %s consecutive failures", host, failures)
+            open_until = now + WEBHOOK_BREAKER_COOLDOWN
+        self._breaker[host] = (failures, open_until)
+    
+    @staticmethod
+    def _response_outcome(delivery_id: str, status_code: int, response_text: str) -> DeliveryOutcome:
+        """Map an HTTP response to a delivery outcome"""
+        if 200 <= status_code < 300:
+            logger.info("Webhook delivered successfully: %s", delivery_id)
+            return 'delivered', status_code, response_text, None
+        
+        logger.warning("Webhook delivery failed with HTTP %s: %s", status_code, delivery_id)
+        return 'failed', status_code, response_text, f"HTTP {status_code}"
+    
+    @staticmethod
+    def _exception_outcome(delivery_id: str, e: Exception) -> DeliveryOutcome:
+        """Map an httpx transport error to a delivery outcome"""
+        if isinstance(e, httpx.TimeoutException):
+            logger.warning("Webhook delivery timeout: %s", delivery_id)
+            return 'failed', None, None, "Request timeout"
+        
+        if isinstance(e, httpx.TransportError):
+            logger.warning("Webhook delivery connection error: %s", delivery_id)
+            return 'failed', None, None, "Connection error"
+        
+        logger.error("Webhook delivery error: %s: %s", delivery_id, e)
+        return 'failed', None, None, str(e)
+    
+    def _post_delivery(self, delivery_id: str, webhook_url: str, body: bytes, signature: str) -> DeliveryOutcome:
+        """
+        Send one delivery over HTTP without touching the database
+        
+        Returns (status, response_status, response_body, error_message) for
+        _update_delivery_status
+        """
+        # Validate webhook URL for security
+        if not is_safe_webhook_url(webhook_url):
+            logger.error("Webhook URL failed security validation: %s", webhook_url)
+            return 'failed', None, None, "Invalid or unsafe webhook URL"
+        
+        try:
+            response = _http.post(webhook_url, content=body, headers={'X-Signature': signature})
+            return self._response_outcome(delivery_id, response.status_code, response.text[:1000])
+        except Exception as e:
+            return self._exception_outcome(delivery_id, e)
+    
+    async def _post_deliveries_async(self, deliveries) -> List[DeliveryOutcome]:
+        """
+        Post deliveries concurrently across hosts and in waves of
+        WEBHOOK_HOST_CONCURRENCY within each host, so a wave's failures reach the
+        circuit breaker before the host's next wave starts
+        """
+        outcomes: List[Optional[DeliveryOutcome]] = [None] * len(deliveries)
+        by_host: Dict[str, List[int]] = {}
+        for index, delivery in enumerate(deliveries):
+            by_host.setdefault(urlparse(delivery.webhook_url).netloc, []).append(index)
+        
+        # One client per call: an AsyncClient's pool is tied to the event loop
+        async with httpx.AsyncClient(**_CLIENT_OPTIONS) as client:
+            async def deliver_host(indexes: List[int]):
+                for start in range(0, len(indexes), WEBHOOK_HOST_CONCURRENCY):
+                    wave = indexes[start:start + WEBHOOK_HOST_CONCURRENCY]
+                    results = await asyncio.gather(*(self._deliver_async(client, deliveries[i]) for i in wave))
+                    for index, outcome in zip(wave, results):
+                        outcomes[index] = outcome
             
+            await asyncio.gather(*(deliver_host(indexes) for indexes in by_host.values()))
+        return outcomes
+    
+    async def _deliver_async(self, client: httpx.AsyncClient, delivery) -> DeliveryOutcome:
+        skipped = self._breaker_check(delivery.webhook_url)
+        if skipped:
+            return skipped
+        
+        outcome = await self._post_delivery_async(
+            client, str(delivery.id), delivery.webhook_url, canonical_body(delivery.payload), delivery.signature
+        )
+        self._breaker_record(delivery.webhook_url, outcome)
+        return outcome
+    
+    async def _post_delivery_async(self, client: httpx.AsyncClient, delivery_id: str, webhook_url: str,
+                                   body: bytes, signature: str) -> DeliveryOutcome:
+        """
+        Async counterpart of _post_delivery on a caller-provided client
+        """
+        if not is_safe_webhook_url(webhook_url):
+            logger.error("Webhook URL failed security validation: %s", webhook_url)
+            return 'failed', None, None, "Invalid or unsafe webhook URL"
+        
+        try:
+            response = await client.post(webhook_url, content=body, headers={'X-Signature': signature})
+            return self._response_outcome(delivery_id, response.status_code, response.text[:1000])
         except Exception as e:
-            self._update_delivery_status(delivery_id, 'failed', None, None, str(e))
-            logger.error(f"Webhook delivery error: {delivery_id}: {str(e)}")
-            return False
+            return self._exception_outcome(delivery_id, e)
     
-    def _update_delivery_status(self, delivery_id: str, status: str, 
+    def _update_delivery_status(self, delivery_id: str, attempt_count: int, status: str,
                                response_status: Optional[int] = None, response_body: Optional[str] = None, 
                                error_message: Optional[str] = None):
-        """Update webhook delivery status"""
+        """Update webhook delivery status after its attempt_count-th attempt"""
         try:
             # Import here to avoid circular imports
             from database.models import WebhookDelivery
             
-            delivery = self.session.query(WebhookDelivery).filter(
-                WebhookDelivery.id == delivery_id
-            ).first()
-            
-            if not delivery:
-                return
-            
-            delivery.status = status
-            delivery.attempt_count += 1
-            delivery.last_attempt_at = datetime.utcnow()
+            now = datetime.utcnow()
+            values: Dict[str, Any] = {
+                'status': status,
+                'attempt_count': attempt_count,
+                'last_attempt_at': now
+            }
             
             if status == 'delivered':
-                delivery.delivered_at = datetime.utcnow()
-            elif status == 'failed' and delivery.attempt_count < self.max_retries:
+                values['delivered_at'] = now
+            elif status == 'failed' and attempt_count < self.max_retries:
                 # Schedule next retry with unified delay strategy
-                attempt_index = min(delivery.attempt_count, len(self.retry_delays) - 1)
-                delay_seconds = self.retry_delays[attempt_index]
-                delivery.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay_seconds)
+                values['next_attempt_at'] = now + timedelta(seconds=self._retry_delay(attempt_count))
             
             if response_status is not None:
-                delivery.response_status = response_status
+                values['response_status'] = response_status
             if response_body:
-                delivery.response_body = response_body[:1000]  # Limit size
+                values['response_body'] = response_body[:1000]  # Limit size
             if error_message:
-                delivery.error_message = error_message[:500]  # Limit size
+                values['error_message'] = error_message[:500]  # Limit size
             
+            # Existence is reported by rowcount, no need to SELECT the row first
+            result = self.session.execute(
+                update(WebhookDelivery)
+                .where(WebhookDelivery.id == delivery_id)
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
             self.session.commit()
             
+            if result.rowcount != 1:
+                logger.warning("Webhook delivery %s not found when updating status", delivery_id)
+            
         except Exception as e:
             self.session.rollback()
-            logger.error(f"Error updating webhook delivery status: {str(e)}")
+            logger.error("Error updating webhook delivery status: %s", e)
     
-    def _generate_signature(self, payload: Dict[str, Any]) -> str:
-        """Generate HMAC signature for webhook payload"""
+    def _generate_signature(self, body: bytes) -> str:
+        """Generate HMAC signature for canonical webhook body bytes"""
         try:
-            payload_json = json.dumps(payload, separators=(',', ':'), sort_keys=True)
-            signature = hmac.new(
-                self.shared_key.encode(),
-                payload_json.encode(),
-                hashlib.sha256
-            ).hexdigest()
+            mac = self._prf.copy()
+            mac.update(body)
+            signature = mac.hexdigest()
             return signature
         except Exception as e:
-            logger.error(f"Error generating webhook signature: {str(e)}")
+            logger.error("Error generating webhook signature: %s", e)
             raise e
     
     def deliver_webhook(self, webhook_delivery) -> bool:
         """
         Deliver single webhook and return success status
         """
-        try:
-            
-            # Prepare payload
-            payload_json = json.dumps(webhook_delivery.payload, separators=(',', ':'))
-            
-            # Send HTTP request
-            response = requests.post(
-                webhook_delivery.webhook_url,
-                data=payload_json,
-                headers={
-                    'Content-Type': 'application/json',
-                    'X-Signature': webhook_delivery.signature,
-                    'User-Agent': 'Generation-Service/1.0'
-                },
-                timeout=30
-            )
-            
-            # Check response
-            if response.status_code in [200, 201, 202]:
-                logger.info(f"Webhook delivered successfully to {webhook_delivery.webhook_url}")
-                return True
-            else:
-                logger.warning(f"Webhook delivery failed with status {response.status_code}: {response.text}")
-                return False
-                
-        except Exception as e:
-            error_type = str(type(e).__name__)
-            if 'Timeout' in error_type:
-                logger.warning(f"Webhook delivery timeout to {webhook_delivery.webhook_url}")
-            elif 'RequestException' in error_type:
-                logger.warning(f"Webhook delivery failed to {webhook_delivery.webhook_url}: {str(e)}")
-            else:
-                logger.error(f"Unexpected error delivering webhook: {str(e)}")
-            return False
\ No newline at end of file
+        # Send the bytes the stored signature was computed over
+        outcome = self._post_delivery(
+            str(webhook_delivery.id), webhook_delivery.webhook_url,
+            canonical_body(webhook_delivery.payload), webhook_delivery.signature
+        )
+        return outcome[0] == 'delivered'
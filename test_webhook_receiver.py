@@ -1,20 +1,45 @@
 """
 Test webhook receiver for testing webhook delivery system
+
+For load tests run it under a threaded server instead of the dev server:
+    gunicorn -k gthread -w 1 --threads 64 -b 0.0.0.0:5001 test_webhook_receiver:app
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request
 import logging
-import json
+import os
 import hmac
 import hashlib
+import threading
+import orjson
+from collections import deque
 from datetime import datetime
+from itertools import islice
+from utils.cache import TTLCache
 
 app = Flask(__name__)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Store received webhooks for verification
-received_webhooks = []
+# Store recent webhooks for verification; bounded so soak tests run in constant memory
+received_webhooks = deque(maxlen=1024)
+received_total = 0
+received_lock = threading.Lock()  # handlers run on concurrent threads
+
+# X-Signature is verified only when SHARED_KEY is set and the request carries the header
+# (WebhookHandler signs inside the JSON body instead); the keyed HMAC is copied per request
+SHARED_KEY = os.environ.get('SHARED_KEY')
+_keyed_hmac = hmac.new(SHARED_KEY.encode(), None, hashlib.sha256) if SHARED_KEY else None
+BODY_CHUNK_SIZE = 64 * 1024
+
+# Replays (retry/backoff tests) resend identical deliveries; a signature that already
+# verified maps to its exact body, so a byte-equal replay skips the HMAC. Only
+# successful verifications are stored, so random signatures cannot fill the cache
+verified_bodies = TTLCache(maxsize=256, ttl=3600)
+
+def json_response(payload):
+    """JSON response body serialized with orjson (used in place of jsonify)"""
+    return app.response_class(orjson.dumps(payload), mimetype='application/json')
 
 @app.route('/test-webhook', methods=['POST'])
 def receive_webhook():
@@ -27,18 +52,46 @@ def receive_webhook():
         user_agent = request.headers.get('User-Agent')
         content_type = request.headers.get('Content-Type')
         
-        # Get body
-        body = request.get_data(as_text=True)
+        # Unsigned requests are accepted and logged as before
+        verify = bool(_keyed_hmac and signature)
+        
+        # A replay of an already verified delivery is checked by comparing bytes
+        known_body = verified_bodies.get(signature) if verify else None
+        
+        # Read the body once, feeding the signature check as chunks arrive
+        body = bytearray()
+        mac = _keyed_hmac.copy() if verify and known_body is None else None
+        while True:
+            chunk = request.stream.read(BODY_CHUNK_SIZE)
+            if not chunk:
+                break
+            body += chunk
+            if mac:
+                mac.update(chunk)
+        
+        if known_body is not None and body != known_body:
+            # Same signature, different body: verify it in full
+            mac = _keyed_hmac.copy()
+            mac.update(body)
+        
+        # Reject bad signatures before paying for JSON parsing
+        if mac:
+            if not hmac.compare_digest(mac.hexdigest(), signature):
+                logger.warning("Rejected webhook with invalid signature")
+                return json_response({
+                    'success': False,
+                    'error': 'Invalid signature'
+                }), 401
+            verified_bodies.set(signature, bytes(body))
         
         # Log receipt
-        logger.info(f"Received webhook at {datetime.utcnow().isoformat()}")
-        logger.info(f"Signature: {signature}")
-        logger.info(f"User-Agent: {user_agent}")
-        logger.info(f"Content-Type: {content_type}")
-        logger.info(f"Body length: {len(body)} bytes")
+        logger.info(
+            "Received webhook: signature=%s user_agent=%s content_type=%s body_length=%d",
+            signature, user_agent, content_type, len(body)
+        )
         
         # Parse JSON
-        data = json.loads(body) if body else {}
+        data = orjson.loads(body) if body else {}
         
         # Store webhook
         webhook_record = {
@@ -46,33 +99,34 @@ def receive_webhook():
             'signature': signature,
             'user_agent': user_agent,
             'data': data,
-            'raw_body': body[:500]  # Store first 500 chars
+            'raw_body': body[:500].decode('utf-8', 'replace')  # Store first 500 bytes
         }
-        received_webhooks.append(webhook_record)
+        global received_total
+        with received_lock:
+            received_webhooks.append(webhook_record)
+            received_total += 1
         
         # Log webhook content
-        if 'job_id' in data:
-            logger.info(f"Job ID: {data['job_id']}")
-        if 'status' in data:
-            logger.info(f"Status: {data['status']}")
+        if logger.isEnabledFor(logging.INFO) and isinstance(data, dict) and ('job_id' in data or 'status' in data):
+            logger.info("Job ID: %s, Status: %s", data.get('job_id'), data.get('status'))
         
         # Return success response
-        return jsonify({
+        return json_response({
             'success': True,
             'message': 'Webhook received successfully',
             'timestamp': datetime.utcnow().isoformat()
         }), 200
         
-    except json.JSONDecodeError as e:
+    except orjson.JSONDecodeError as e:
         logger.error(f"Invalid JSON in webhook: {str(e)}")
-        return jsonify({
+        return json_response({
             'success': False,
             'error': 'Invalid JSON payload'
         }), 400
         
     except Exception as e:
         logger.error(f"Error processing webhook: {str(e)}")
-        return jsonify({
+        return json_response({
             'success': False,
             'error': 'Internal server error'
         }), 500
@@ -82,9 +136,13 @@ def webhook_status():
     """
     Get status of received webhooks
     """
-    return jsonify({
-        'total_received': len(received_webhooks),
-        'webhooks': received_webhooks[-10:]  # Last 10 webhooks
+    with received_lock:
+        total = received_total
+        # Last 10 webhooks, oldest first
+        recent = list(islice(reversed(received_webhooks), 10))[::-1]
+    return json_response({
+        'total_received': total,
+        'webhooks': recent
     }), 200
 
 @app.route('/webhooks/clear', methods=['POST'])
@@ -92,16 +150,18 @@ def clear_webhooks():
     """
     Clear stored webhooks
     """
-    global received_webhooks
-    received_webhooks = []
-    return jsonify({'success': True, 'message': 'Webhooks cleared'}), 200
+    global received_total
+    with received_lock:
+        received_webhooks.clear()
+        received_total = 0
+    return json_response({'success': True, 'message': 'Webhooks cleared'}), 200
 
 @app.route('/health', methods=['GET'])
 def health():
     """
     Health check endpoint
     """
-    return jsonify({
+    return json_response({
         'status': 'healthy',
         'service': 'test-webhook-receiver',
         'timestamp': datetime.utcnow().isoformat()
@@ -109,4 +169,9 @@ def health():
 
 if __name__ == '__main__':
     logger.info("Starting test webhook receiver on port 5001")
-    app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
+    # Threaded so concurrent deliveries are not serialized behind one request;
+    # the debugger is opt-in (WH_DEBUG=1) and the reloader stays off either way
+    app.run(
+        host='0.0.0.0', port=5001, threaded=True,
+        debug=os.environ.get('WH_DEBUG') == '1', use_reloader=False
+    )
\ No newline at end of file
@@ -5,6 +5,12 @@
 import os
 import hmac
 import hashlib
+from functools import lru_cache
+
+@lru_cache(maxsize=8)
+def _keyed_hmac(shared_key):
+    """HMAC-SHA256 с уже подготовленным ключом; копируется на каждую подпись"""
+    return hmac.new(shared_key.encode(), None, hashlib.sha256)
 
 def check_server_shared_key():
     """Проверяет настройки SHARED_KEY на сервере"""
@@ -26,11 +32,7 @@ def check_server_shared_key():
     print(f"🔒 Маскированный ключ: {masked_key}")
     
     # Генерируем тестовую подпись для пустого payload
-    test_signature = hmac.new(
-        shared_key.encode(),
-        "".encode(),
-        hashlib.sha256
-    ).hexdigest()
+    test_signature = generate_signature_for_client(shared_key, "")
     
     print(f"🔐 Тестовая подпись для GET запроса: {test_signature}")
     
@@ -41,11 +43,9 @@ def generate_signature_for_client(shared_key, payload=""):
     if not shared_key:
         return None
         
-    return hmac.new(
-        shared_key.encode(),
-        payload.encode(),
-        hashlib.sha256
-    ).hexdigest()
+    mac = _keyed_hmac(shared_key).copy()
+    mac.update(payload.encode() if isinstance(payload, str) else payload)
+    return mac.hexdigest()
 
 if __name__ == "__main__":
     print("🔍 Проверка настроек сервера")
@@ -23,16 +23,11 @@ def debug_batch_results():
         print(f"Batch Status: {batch_status['status']}")
         print(f"Output File ID: {batch_status.get('output_file_id')}")
         
-        # Загружаем результаты
-        results_content = client.download_batch_results(batch_status['output_file_id'])
-        
-        # Анализируем первые несколько результатов
-        lines = results_content.strip().split('\n')
-        print(f"\nВсего строк результатов: {len(lines)}")
-        
-        for i, line in enumerate(lines[:3]):  # Первые 3 результата
-            if line:
-                result = json.loads(line)
+        # Загружаем результаты потоком и анализируем первые несколько
+        total = 0
+        for i, result in enumerate(client.iter_batch_results(batch_status['output_file_id'])):
+            total += 1
+            if i < 3:  # Первые 3 результата
                 print(f"\n=== Результат {i+1} ===")
                 print(f"Custom ID: {result.get('custom_id')}")
                 
@@ -63,6 +58,8 @@ def debug_batch_results():
                 # Показываем полную структуру для понимания
                 print(f"Полная структура response:")
                 print(json.dumps(response, indent=2)[:500] + "...")
+        
+        print(f"\nВсего строк результатов: {total}")
                 
     except Exception as e:
         print(f"Ошибка: {e}")
@@ -5,11 +5,12 @@ This script re-downloads and re-processes OpenAI batch results.
 """
 
 import os
+import re
 import sys
-import json
 import logging
-from datetime import datetime
-from sqlalchemy import create_engine
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from sqlalchemy import bindparam, case, create_engine, func, or_, update
 from sqlalchemy.orm import sessionmaker
 
 # Add parent directory to path
@@ -21,18 +22,73 @@ from models.batch_models import BatchJob, BatchLot
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def fix_batch_results(job_id: str):
-    """Fix batch results for a specific job"""
+# Jobs fixed in parallel by main()
+FIX_WORKERS = 16
+
+# vision:<lot_id> or vision:<prefix>:<lot_id>[:...]; group 1 is the lot_id
+VISION_CUSTOM_ID = re.compile(r'vision:(?:[^:]*:)?([^:]*)')
+
+def extract_output_text(result) -> str:
+    """The actual text of a batch result: response.body.output[0].content[0].text, or '' if absent"""
+    try:
+        return result['response']['body']['output'][0]['content'][0]['text'] or ''
+    except (KeyError, IndexError, TypeError):
+        return ''
+
+def result_state():
+    """
+    SQL expression classifying a stored vision_result as 'missing', 'broken'
+    (contains the format structure) or 'valid', so the text never leaves the database
+    """
+    return case(
+        (or_(BatchLot.vision_result.is_(None), BatchLot.vision_result == ''), 'missing'),
+        (or_(
+            BatchLot.vision_result.like("%'format'%"),
+            BatchLot.vision_result.like("%{'type': 'text'}%")
+        ), 'broken'),
+        else_='valid'
+    )
+
+def fix_lots_statement():
+    """
+    Core executemany UPDATE of batch_lots by id (no ORM flush or identity map);
+    a NULL status parameter keeps the lot's current status
+    """
+    lots = BatchLot.__table__
+    return update(lots).where(
+        lots.c.id == bindparam('b_id')
+    ).values(
+        vision_result=bindparam('vr'),
+        status=func.coalesce(bindparam('st'), lots.c.status)
+    )
+
+def load_lot_map(Session, job_pk) -> dict:
+    """
+    Map lot_id -> (id, result state, status) for a job's lots, on its own session
+    so it can run in a worker thread; rows are streamed and no ORM objects or texts are kept
+    """
+    session = Session()
+    try:
+        lot_rows = session.query(
+            BatchLot.id, BatchLot.lot_id, result_state().label('state'), BatchLot.status
+        ).filter(
+            BatchLot.batch_job_id == job_pk
+        ).yield_per(1000)
+        return {row.lot_id: (row.id, row.state, row.status) for row in lot_rows}
+    finally:
+        session.close()
+
+def fix_batch_results(Session, job_id: str):
+    """Fix batch results for a specific job, on sessions from the shared Session factory"""
     
-    # Initialize database
-    database_url = os.environ.get('DATABASE_URL')
-    engine = create_engine(database_url)
-    Session = sessionmaker(bind=engine)
     session = Session()
     
     # Initialize OpenAI client
     openai_client = OpenAIClient()
     
+    # The lot query only needs the job id, so it overlaps the OpenAI calls
+    executor = ThreadPoolExecutor(max_workers=1)
+    
     try:
         # Get job from database
         job = session.query(BatchJob).filter(
@@ -44,6 +100,7 @@ def fix_batch_results(job_id: str):
             return False
         
         logger.info(f"Processing job {job_id} with OpenAI batch ID: {job.openai_batch_id}")
+        lot_map_future = executor.submit(load_lot_map, Session, job.id)
         
         # Get batch status from OpenAI
         batch_status = openai_client.get_batch_status(job.openai_batch_id)
@@ -56,91 +113,64 @@ def fix_batch_results(job_id: str):
             logger.error("No output file ID in batch status")
             return False
         
-        # Download results from OpenAI
+        # Open the results stream (request + first record) before waiting on the lot query
         logger.info(f"Downloading results from file {batch_status['output_file_id']}")
-        results_content = openai_client.download_batch_results(batch_status['output_file_id'])
-        
-        # Parse results
-        results = []
-        for line in results_content.strip().split('\n'):
-            if line.strip():
-                results.append(json.loads(line))
-        
-        logger.info(f"Parsed {len(results)} results from OpenAI")
+        results = openai_client.iter_batch_results(batch_status['output_file_id'])
+        first_result = next(results, None)
         
-        # Get all lots for this job
-        lots = session.query(BatchLot).filter(
-            BatchLot.batch_job_id == job.id
-        ).all()
+        lot_map = lot_map_future.result()
+        logger.info(f"Found {len(lot_map)} lots in database")
         
-        lot_map = {lot.lot_id: lot for lot in lots}
-        logger.info(f"Found {len(lots)} lots in database")
-        
-        # Process each result
-        fixed_count = 0
-        for result in results:
+        # Stream the remaining results, processing each record as it is parsed
+        parsed_count = 0
+        updates = []
+        for result in chain([first_result] if first_result is not None else [], results):
+            parsed_count += 1
             custom_id = result.get('custom_id', '')
             
             if not custom_id.startswith('vision:'):
                 continue
             
             # Parse lot_id from custom_id
-            parts = custom_id.split(':')
-            if len(parts) == 2:
-                lot_id = parts[1]
-            elif len(parts) >= 3:
-                lot_id = parts[2]
-            else:
+            match = VISION_CUSTOM_ID.match(custom_id)
+            if not match:
                 logger.warning(f"Invalid custom_id format: {custom_id}")
                 continue
+            lot_id = match.group(1)
             
             if lot_id not in lot_map:
                 logger.warning(f"Lot {lot_id} not found in database")
                 continue
             
-            lot = lot_map[lot_id]
+            lot_pk, state, status = lot_map[lot_id]
             
             # Extract the actual text from the correct location
-            response_data = result.get('response', {})
-            body = response_data.get('body', {})
-            
-            # The actual text is in: body.output[0].content[0].text
-            vision_text = ''
-            output = body.get('output', [])
-            
-            if output and isinstance(output, list) and len(output) > 0:
-                first_output = output[0]
-                if isinstance(first_output, dict):
-                    content = first_output.get('content', [])
-                    if content and isinstance(content, list) and len(content) > 0:
-                        first_content = content[0]
-                        if isinstance(first_content, dict):
-                            vision_text = first_content.get('text', '')
+            vision_text = extract_output_text(result)
             
             if vision_text:
                 # Check if this lot needs fixing
-                current_result = lot.vision_result
-                if current_result and isinstance(current_result, str):
-                    # Check if it contains the incorrect format structure
-                    if "'format'" in current_result or "{'type': 'text'}" in current_result:
-                        logger.info(f"Fixing lot {lot_id}: replacing format structure with actual text ({len(vision_text)} chars)")
-                        lot.vision_result = vision_text
-                        lot.updated_at = datetime.utcnow()
-                        fixed_count += 1
-                    else:
-                        logger.info(f"Lot {lot_id} already has valid text, skipping")
+                if state == 'broken':
+                    logger.info(f"Fixing lot {lot_id}: replacing format structure with actual text ({len(vision_text)} chars)")
+                    updates.append({'b_id': lot_pk, 'vr': vision_text, 'st': None})
+                elif state == 'valid':
+                    logger.info(f"Lot {lot_id} already has valid text, skipping")
                 else:
                     logger.info(f"Setting vision result for lot {lot_id}: {len(vision_text)} chars")
-                    lot.vision_result = vision_text
-                    lot.status = 'completed' if lot.status != 'failed' else lot.status
-                    lot.updated_at = datetime.utcnow()
-                    fixed_count += 1
+                    updates.append({
+                        'b_id': lot_pk,
+                        'vr': vision_text,
+                        'st': 'completed' if status != 'failed' else status
+                    })
             else:
                 logger.error(f"Could not extract text for lot {lot_id}")
         
-        # Commit changes
+        logger.info(f"Parsed {parsed_count} results from OpenAI")
+        
+        # Bulk UPDATE by primary key, then commit
+        if updates:
+            session.execute(fix_lots_statement(), updates)
         session.commit()
-        logger.info(f"Fixed {fixed_count} lots for job {job_id}")
+        logger.info(f"Fixed {len(updates)} lots for job {job_id}")
         
         return True
         
@@ -149,42 +179,59 @@ def fix_batch_results(job_id: str):
         logger.error(f"Error fixing batch results: {str(e)}")
         return False
     finally:
+        executor.shutdown(wait=True)
         session.close()
 
+def verify_fix(session, job_id: str):
+    """Print the first few lots of a fixed job"""
+    lots = session.query(BatchLot.lot_id, BatchLot.vision_result).filter(
+        BatchLot.batch_job_id == job_id
+    ).limit(3).all()
+    
+    print(f"\n=== Verification: {job_id} ===")
+    for lot in lots:
+        result = lot.vision_result
+        if result:
+            print(f"\nLot {lot.lot_id}:")
+            print(f"  Result length: {len(result)} chars")
+            print(f"  Preview: {result[:150]}...")
+        else:
+            print(f"\nLot {lot.lot_id}: No result")
+
 def main():
     """Main function to fix all affected jobs"""
     
-    # Job ID from the user's request
-    job_id = "64734dab-3961-4014-8b2b-196302b5d047"
+    # Job IDs from the command line, defaulting to the job from the user's request
+    job_ids = sys.argv[1:] or ["64734dab-3961-4014-8b2b-196302b5d047"]
     
-    logger.info(f"Fixing batch results for job {job_id}")
+    logger.info(f"Fixing batch results for {len(job_ids)} job(s)")
     
-    if fix_batch_results(job_id):
-        logger.info("Successfully fixed batch results!")
-        
-        # Verify the fix
-        database_url = os.environ.get('DATABASE_URL')
-        engine = create_engine(database_url)
-        Session = sessionmaker(bind=engine)
-        session = Session()
-        
-        lots = session.query(BatchLot).filter(
-            BatchLot.batch_job_id == job_id
-        ).limit(3).all()
+    # One engine for every job; each job holds its own session plus one for the lot query
+    database_url = os.environ.get('DATABASE_URL')
+    engine = create_engine(database_url, pool_size=2 * FIX_WORKERS, max_overflow=0)
+    Session = sessionmaker(bind=engine)
+    try:
+        # I/O bound (OpenAI + SQL), so jobs run on threads; each call has its own session and client
+        with ThreadPoolExecutor(max_workers=min(FIX_WORKERS, len(job_ids))) as executor:
+            outcomes = list(executor.map(lambda job_id: fix_batch_results(Session, job_id), job_ids))
         
-        print("\n=== Verification ===")
-        for lot in lots:
-            result = lot.vision_result
-            if result:
-                print(f"\nLot {lot.lot_id}:")
-                print(f"  Result length: {len(result)} chars")
-                print(f"  Preview: {result[:150]}...")
-            else:
-                print(f"\nLot {lot.lot_id}: No result")
+        fixed_ids = [job_id for job_id, ok in zip(job_ids, outcomes) if ok]
+        for job_id, ok in zip(job_ids, outcomes):
+            if not ok:
+                logger.error(f"Failed to fix batch results for job {job_id}")
         
-        session.close()
-    else:
-        logger.error("Failed to fix batch results")
+        if fixed_ids:
+            logger.info(f"Successfully fixed batch results for {len(fixed_ids)} job(s)!")
+            
+            # Verify the fix
+            session = Session()
+            try:
+                for job_id in fixed_ids:
+                    verify_fix(session, job_id)
+            finally:
+                session.close()
+    finally:
+        engine.dispose()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
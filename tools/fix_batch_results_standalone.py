@@ -4,12 +4,15 @@ Standalone script to fix batch results.
 """
 
 import os
-import json
+import re
+import sys
+import orjson
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from openai import OpenAI
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,11 +21,31 @@ logger = logging.getLogger(__name__)
 DATABASE_URL = os.environ.get('DATABASE_URL')
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
 
-def fix_batch_results(job_id: str):
+# Jobs fixed in parallel by main(); its pool holds one connection per worker
+FIX_WORKERS = 16
+
+# vision:<lot_id> or vision:<prefix>:<lot_id>[:...]; group 1 is the lot_id
+VISION_CUSTOM_ID = re.compile(r'vision:(?:[^:]*:)?([^:]*)')
+
+def extract_output_text(result) -> str:
+    """The actual text of a batch result: response.body.output[0].content[0].text, or '' if absent"""
+    try:
+        return result['response']['body']['output'][0]['content'][0]['text'] or ''
+    except (KeyError, IndexError, TypeError):
+        return ''
+
+def iter_batch_results(client: OpenAI, file_id: str):
+    """Yield parsed JSONL records from a batch output file as they stream in"""
+    with client.files.with_streaming_response.content(file_id) as response:
+        for line in response.iter_lines():
+            if line.strip():
+                yield orjson.loads(line)
+
+def fix_batch_results(pool: ThreadedConnectionPool, job_id: str):
     """Fix batch results for a specific job"""
     
-    # Connect to database
-    conn = psycopg2.connect(DATABASE_URL)
+    # Borrow a connection from the shared pool
+    conn = pool.getconn()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     
     # Initialize OpenAI client
@@ -51,43 +74,39 @@ def fix_batch_results(job_id: str):
             logger.error("No output file ID in batch status")
             return False
         
-        # Download results from OpenAI
-        logger.info(f"Downloading results from file {batch.output_file_id}")
-        file_response = client.files.content(batch.output_file_id)
-        results_content = file_response.read().decode('utf-8')
-        
-        # Parse results
-        results = []
-        for line in results_content.strip().split('\n'):
-            if line.strip():
-                results.append(json.loads(line))
-        
-        logger.info(f"Parsed {len(results)} results from OpenAI")
-        
-        # Get all lots for this job
-        cur.execute("SELECT * FROM batch_lots WHERE batch_job_id = %s", (job_id,))
+        # Get all lots for this job; the database classifies vision_result so the text is never transferred
+        cur.execute(
+            "SELECT id, lot_id, status, "
+            "CASE WHEN vision_result IS NULL OR vision_result = '' THEN 'missing' "
+            "WHEN vision_result LIKE %s OR vision_result LIKE %s THEN 'broken' "
+            "ELSE 'valid' END AS result_state "
+            "FROM batch_lots WHERE batch_job_id = %s",
+            ("%'format'%", "%{'type': 'text'}%", job_id)
+        )
         lots = cur.fetchall()
         
         lot_map = {lot['lot_id']: lot for lot in lots}
         logger.info(f"Found {len(lots)} lots in database")
         
-        # Process each result
-        fixed_count = 0
-        for result in results:
+        # Stream results from OpenAI, processing each record as it is parsed
+        logger.info(f"Downloading results from file {batch.output_file_id}")
+        parsed_count = 0
+        # (lot id, vision_result, new status or None to keep, updated_at), written in bulk below
+        updates = []
+        now = datetime.utcnow()
+        for result in iter_batch_results(client, batch.output_file_id):
+            parsed_count += 1
             custom_id = result.get('custom_id', '')
             
             if not custom_id.startswith('vision:'):
                 continue
             
             # Parse lot_id from custom_id
-            parts = custom_id.split(':')
-            if len(parts) == 2:
-                lot_id = parts[1]
-            elif len(parts) >= 3:
-                lot_id = parts[2]
-            else:
+            match = VISION_CUSTOM_ID.match(custom_id)
+            if not match:
                 logger.warning(f"Invalid custom_id format: {custom_id}")
                 continue
+            lot_id = match.group(1)
             
             if lot_id not in lot_map:
                 logger.warning(f"Lot {lot_id} not found in database")
@@ -96,49 +115,39 @@ def fix_batch_results(job_id: str):
             lot = lot_map[lot_id]
             
             # Extract the actual text from the correct location
-            response_data = result.get('response', {})
-            body = response_data.get('body', {})
-            
-            # The actual text is in: body.output[0].content[0].text
-            vision_text = ''
-            output = body.get('output', [])
-            
-            if output and isinstance(output, list) and len(output) > 0:
-                first_output = output[0]
-                if isinstance(first_output, dict):
-                    content = first_output.get('content', [])
-                    if content and isinstance(content, list) and len(content) > 0:
-                        first_content = content[0]
-                        if isinstance(first_content, dict):
-                            vision_text = first_content.get('text', '')
+            vision_text = extract_output_text(result)
             
             if vision_text:
                 # Check if this lot needs fixing
-                current_result = lot['vision_result']
-                if current_result and isinstance(current_result, str):
-                    # Check if it contains the incorrect format structure
-                    if "'format'" in current_result or "{'type': 'text'}" in current_result:
-                        logger.info(f"Fixing lot {lot_id}: replacing format structure with actual text ({len(vision_text)} chars)")
-                        cur.execute(
-                            "UPDATE batch_lots SET vision_result = %s, updated_at = %s WHERE id = %s",
-                            (vision_text, datetime.utcnow(), lot['id'])
-                        )
-                        fixed_count += 1
-                    else:
-                        logger.info(f"Lot {lot_id} already has valid text, skipping")
+                if lot['result_state'] == 'broken':
+                    logger.info(f"Fixing lot {lot_id}: replacing format structure with actual text ({len(vision_text)} chars)")
+                    updates.append((lot['id'], vision_text, None, now))
+                elif lot['result_state'] == 'valid':
+                    logger.info(f"Lot {lot_id} already has valid text, skipping")
                 else:
                     logger.info(f"Setting vision result for lot {lot_id}: {len(vision_text)} chars")
-                    cur.execute(
-                        "UPDATE batch_lots SET vision_result = %s, status = 'completed', updated_at = %s WHERE id = %s",
-                        (vision_text, datetime.utcnow(), lot['id'])
-                    )
-                    fixed_count += 1
+                    updates.append((lot['id'], vision_text, 'completed', now))
             else:
                 logger.error(f"Could not extract text for lot {lot_id}")
         
+        logger.info(f"Parsed {parsed_count} results from OpenAI")
+        
+        # One UPDATE ... FROM (VALUES ...) per 500 lots instead of a round trip per lot
+        if updates:
+            execute_values(
+                cur,
+                "UPDATE batch_lots AS b "
+                "SET vision_result = v.vision_result, status = COALESCE(v.status, b.status), updated_at = v.updated_at "
+                "FROM (VALUES %s) AS v(id, vision_result, status, updated_at) "
+                "WHERE b.id = v.id",
+                updates,
+                template="(%s::uuid, %s, %s, %s::timestamp)",
+                page_size=500
+            )
+        
         # Commit changes
         conn.commit()
-        logger.info(f"Fixed {fixed_count} lots for job {job_id}")
+        logger.info(f"Fixed {len(updates)} lots for job {job_id}")
         
         return True
         
@@ -150,43 +159,60 @@ def fix_batch_results(job_id: str):
         return False
     finally:
         cur.close()
-        conn.close()
+        pool.putconn(conn)
+
+def verify_fix(cur, job_id: str):
+    """Print the first few lots of a fixed job"""
+    cur.execute(
+        "SELECT lot_id, vision_result FROM batch_lots WHERE batch_job_id = %s LIMIT 3",
+        (job_id,)
+    )
+    lots = cur.fetchall()
+    
+    print(f"\n=== Verification: {job_id} ===")
+    for lot in lots:
+        result = lot['vision_result']
+        if result:
+            print(f"\nLot {lot['lot_id']}:")
+            print(f"  Result length: {len(result)} chars")
+            print(f"  Preview: {result[:150]}...")
+        else:
+            print(f"\nLot {lot['lot_id']}: No result")
 
 def main():
     """Main function to fix all affected jobs"""
     
-    # Job ID from the user's request
-    job_id = "64734dab-3961-4014-8b2b-196302b5d047"
+    # Job IDs from the command line, defaulting to the job from the user's request
+    job_ids = sys.argv[1:] or ["64734dab-3961-4014-8b2b-196302b5d047"]
     
-    logger.info(f"Fixing batch results for job {job_id}")
+    logger.info(f"Fixing batch results for {len(job_ids)} job(s)")
     
-    if fix_batch_results(job_id):
-        logger.info("Successfully fixed batch results!")
-        
-        # Verify the fix
-        conn = psycopg2.connect(DATABASE_URL)
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cur.execute(
-            "SELECT lot_id, vision_result FROM batch_lots WHERE batch_job_id = %s LIMIT 3",
-            (job_id,)
-        )
-        lots = cur.fetchall()
+    # One pool for the fixes and the verification, created before any worker starts
+    pool = ThreadedConnectionPool(1, FIX_WORKERS, DATABASE_URL)
+    try:
+        # I/O bound (OpenAI + SQL), so jobs run on threads; each borrows its own pooled connection
+        with ThreadPoolExecutor(max_workers=min(FIX_WORKERS, len(job_ids))) as executor:
+            outcomes = list(executor.map(lambda job_id: fix_batch_results(pool, job_id), job_ids))
         
-        print("\n=== Verification ===")
-        for lot in lots:
-            result = lot['vision_result']
-            if result:
-                print(f"\nLot {lot['lot_id']}:")
-                print(f"  Result length: {len(result)} chars")
-                print(f"  Preview: {result[:150]}...")
-            else:
-                print(f"\nLot {lot['lot_id']}: No result")
+        fixed_ids = [job_id for job_id, ok in zip(job_ids, outcomes) if ok]
+        for job_id, ok in zip(job_ids, outcomes):
+            if not ok:
+                logger.error(f"Failed to fix batch results for job {job_id}")
         
-        cur.close()
-        conn.close()
-    else:
-        logger.error("Failed to fix batch results")
+        if fixed_ids:
+            logger.info(f"Successfully fixed batch results for {len(fixed_ids)} job(s)!")
+            
+            # Verify the fix on a pooled connection
+            conn = pool.getconn()
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            try:
+                for job_id in fixed_ids:
+                    verify_fix(cur, job_id)
+            finally:
+                cur.close()
+                pool.putconn(conn)
+    finally:
+        pool.closeall()
 
 if __name__ == "__main__":
     main()
@@ -1,28 +1,42 @@
 #!/usr/bin/env python3
 """
 Force process a specific batch job manually
+
+With --defer the job is only checked against the background worker's poll
+(DatabaseManager.get_active_batch_jobs) and left to the resident worker, so the
+CLI returns without waiting on OpenAI. --defer does nothing when the resident
+worker is disabled (DEPLOYMENT_TARGET=autoscale): nobody picks the job up
 """
 
 import os
 import sys
 import logging
 sys.path.insert(0, '/home/runner/workspace')
+# Importing app starts a BackgroundWorker unless deployment is autoscale;
+# this CLI must not run a second worker beside the resident one
+os.environ['DEPLOYMENT_TARGET'] = 'autoscale'
+os.environ['ENABLE_BACKGROUND_SERVICES'] = 'false'
 from app import app
-from services.batch_monitor import BatchMonitor
 from services.database_manager import DatabaseManager
 from database.models import db
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def force_process_job(job_id):
-    """Force process a specific job"""
+def polled_by_worker(job):
+    """Whether the background worker's next poll will check this job (same filter as get_active_batch_jobs)"""
+    return (
+        job.status in ('pending', 'processing', 'failed') and
+        bool(job.openai_vision_batch_id or job.openai_translation_batch_id)
+    )
+
+def force_process_job(job_id, defer=False):
+    """Force process a specific job, or with defer=True hand it to the background worker"""
     
     with app.app_context():
         try:
             # Initialize services
             db_manager = DatabaseManager(db.session)
-            batch_monitor = BatchMonitor()
             
             # Get the job
             job = db_manager.get_batch_job(job_id)
@@ -33,6 +47,16 @@ def force_process_job(job_id):
             logger.info(f"Processing job {job_id} with status {job.status}")
             logger.info(f"OpenAI batch: {job.openai_batch_id}")
             
+            if defer:
+                if polled_by_worker(job):
+                    logger.info(f"Job {job_id} will be checked by the background worker on its next poll")
+                    return True
+                logger.info(f"Job {job_id} is not polled by the background worker, processing in-process")
+            
+            # Imported here so a deferred job never builds a BatchMonitor
+            from services.batch_monitor import BatchMonitor
+            batch_monitor = BatchMonitor()
+            
             # Force check this specific job
             if job.openai_batch_id and job.status in ['processing', 'failed']:
                 logger.info(f"Checking OpenAI batch {job.openai_batch_id}")
@@ -55,10 +79,15 @@ def force_process_job(job_id):
             return False
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python force_process_job.py <job_id>")
+    args = sys.argv[1:]
+    defer = '--defer' in args
+    if defer:
+        args.remove('--defer')
+    if len(args) != 1:
+        print("Usage: python force_process_job.py [--defer] <job_id>")
+        print("  --defer  leave the job to the resident background worker (no effect if that worker is disabled)")
         sys.exit(1)
     
-    job_id = sys.argv[1]
-    success = force_process_job(job_id)
+    job_id = args[0]
+    success = force_process_job(job_id, defer=defer)
     sys.exit(0 if success else 1)
\ No newline at end of file
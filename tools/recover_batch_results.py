@@ -5,9 +5,11 @@
 """
 import os
 import sys
-import json
+import time
+import orjson
 import logging
-from datetime import datetime
+import tempfile
+from sqlalchemy import update
 
 # Добавляем путь к проекту
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -20,6 +22,15 @@ from app import app
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Восстановленные лоты записываются и коммитятся пачками такого размера
+SAVE_CHUNK_SIZE = 500
+
+# Выходные файлы batch в OpenAI неизменяемы, поэтому повторный запуск читает локальную копию
+RESULTS_CACHE_DIR = os.environ.get(
+    'BATCH_RESULTS_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'bachai_batch_results')
+)
+RESULTS_CACHE_TTL = 7 * 24 * 3600  # 7 дней
+
 class BatchResultsRecovery:
     def __init__(self):
         self.openai_client = OpenAIClient()
@@ -66,15 +77,9 @@ class BatchResultsRecovery:
                 logger.error(f"OpenAI batch не завершен: {batch_status['status']}")
                 return False
             
-            # Загружаем результаты
-            results_content = self.openai_client.download_batch_results(
-                batch_status['output_file_id']
-            )
-            logger.info(f"Загружено {len(results_content.split())} строк результатов")
-            
-            # Парсим результаты
-            vision_results = self._parse_batch_results(results_content)
-            logger.info(f"Распарсено {len(vision_results)} результатов")
+            # Загружаем (или читаем из локального кэша) и парсим результаты потоково, по одной строке
+            lines = self._iter_result_lines(batch_status['output_file_id'])
+            vision_results = self._parse_batch_results(lines)
             
             # Сохраняем в БД
             return self._save_vision_results(job, vision_results, db_manager)
@@ -83,35 +88,65 @@ class BatchResultsRecovery:
             logger.error(f"Ошибка восстановления vision результатов: {str(e)}")
             return False
     
-    def _parse_batch_results(self, results_content: str):
-        """Парсить результаты batch от OpenAI"""
-        import json
-        results = []
+    def _iter_result_lines(self, file_id: str):
+        """
+        Строки выходного файла batch: из дискового кэша, если он свежий, иначе из OpenAI
+        с записью в кэш (файл становится видимым только после полной загрузки)
+        """
+        path = os.path.join(RESULTS_CACHE_DIR, f"{file_id}.jsonl")
+        try:
+            fresh = time.time() - os.path.getmtime(path) < RESULTS_CACHE_TTL
+        except OSError:
+            fresh = False
         
-        for line in results_content.strip().split('\n'):
-            if line:
-                try:
-                    result = json.loads(line)
-                    results.append(result)
-                except json.JSONDecodeError as e:
-                    logger.warning(f"Не удалось распарсить строку: {line[:100]}...")
-                    
-        return results
+        if fresh:
+            logger.info(f"Читаем результаты из кэша: {path}")
+            # Текстовый режим: те же str без '\n', что и при загрузке из OpenAI
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.rstrip('\n')
+                    if line.strip():
+                        yield line
+            return
+        
+        os.makedirs(RESULTS_CACHE_DIR, exist_ok=True)
+        partial_path = f"{path}.{os.getpid()}.part"
+        try:
+            with open(partial_path, 'w', encoding='utf-8') as cache_file:
+                for line in self.openai_client.iter_batch_result_lines(file_id):
+                    cache_file.write(line)
+                    cache_file.write('\n')
+                    yield line
+            os.replace(partial_path, path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+    
+    def _parse_batch_results(self, lines):
+        """Парсить результаты batch от OpenAI (генератор, строки пропускаются при ошибке)"""
+        for line in lines:
+            try:
+                yield orjson.loads(line)
+            except orjson.JSONDecodeError:
+                logger.warning(f"Не удалось распарсить строку: {line[:100]}...")
     
-    def _save_vision_results(self, job, vision_results: list, db_manager):
+    def _save_vision_results(self, job, vision_results, db_manager):
         """Сохранить результаты анализа изображений в БД"""
         try:
-            # Получаем все лоты для этой задачи
-            lots = db_manager.session.query(BatchLot).filter(
+            # Получаем id всех лотов этой задачи (без загрузки ORM-объектов)
+            lot_map = dict(db_manager.session.query(BatchLot.lot_id, BatchLot.id).filter(
                 BatchLot.batch_job_id == job.id
-            ).all()
-            
-            lot_map = {getattr(lot, 'lot_id'): lot for lot in lots}
-            logger.info(f"Найдено {len(lots)} лотов для обработки")
+            ).all())
+            logger.info(f"Найдено {len(lot_map)} лотов для обработки")
             
             successful_lots = 0
+            result_count = 0
+            # Изменения по id лота; пишутся одним UPDATE и коммитятся каждые SAVE_CHUNK_SIZE лотов,
+            # чтобы не держать одну транзакцию на всё время разбора
+            pending = {}
             
             for result in vision_results:
+                result_count += 1
                 if not isinstance(result, dict):
                     continue
                     
@@ -180,22 +215,27 @@ class BatchResultsRecovery:
                 
                 # Сохраняем результат
                 if lot_id in lot_map and vision_text:
-                    lot = lot_map[lot_id]
-                    setattr(lot, 'vision_result', vision_text)
-                    setattr(lot, 'status', 'completed')
-                    setattr(lot, 'updated_at', datetime.utcnow())
+                    lot_pk = lot_map[lot_id]
+                    pending[lot_pk] = {
+                        'id': lot_pk,
+                        'vision_result': vision_text,
+                        'status': 'completed'
+                    }
+                    if len(pending) >= SAVE_CHUNK_SIZE:
+                        self._flush_lot_updates(pending, db_manager)
                     successful_lots += 1
                     logger.info(f"Восстановлен результат для лота {lot_id}: {len(vision_text)} символов")
                 else:
                     logger.warning(f"Не удалось восстановить результат для лота {lot_id}")
             
+            self._flush_lot_updates(pending, db_manager)
+            
             # Обновляем статистику задачи
             setattr(job, 'processed_lots', successful_lots)
-            setattr(job, 'updated_at', datetime.utcnow())
             
             # Сохраняем в БД
             db_manager.session.commit()
-            logger.info(f"Успешно восстановлено {successful_lots} из {len(lots)} лотов")
+            logger.info(f"Успешно восстановлено {successful_lots} из {len(lot_map)} лотов ({result_count} результатов)")
             
             return successful_lots > 0
             
@@ -203,6 +243,14 @@ class BatchResultsRecovery:
             db_manager.session.rollback()
             logger.error(f"Ошибка сохранения результатов: {str(e)}")
             return False
+    
+    def _flush_lot_updates(self, pending: dict, db_manager):
+        """Записать накопленные изменения лотов одним bulk UPDATE и закоммитить пачку"""
+        if not pending:
+            return
+        db_manager.session.execute(update(BatchLot), list(pending.values()))
+        db_manager.session.commit()
+        pending.clear()
 
 def main():
     if len(sys.argv) != 2:
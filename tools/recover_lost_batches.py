@@ -4,12 +4,14 @@ Script to recover lost batch connections by scanning OpenAI batches and matching
 """
 
 import os
+import re
 import json
 import logging
-from datetime import datetime
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
 from openai import OpenAI
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,6 +20,10 @@ logger = logging.getLogger(__name__)
 DATABASE_URL = os.environ.get('DATABASE_URL')
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
 
+# Job ids embedded in batch descriptions (e.g. "Translation for job <uuid>")
+JOB_ID_PATTERN = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}', re.IGNORECASE)
+TIMING_WINDOW = timedelta(minutes=10)
+
 def recover_lost_batch_connections():
     """Find and recover lost batch connections"""
     
@@ -28,8 +34,9 @@ def recover_lost_batch_connections():
     
     try:
         # Find jobs without OpenAI batch IDs but with processing/translating status
+        # (served by the ix_batchjob_orphaned partial index; only the matching columns are read)
         cur.execute("""
-            SELECT id, status, created_at, updated_at
+            SELECT id, created_at
             FROM batch_jobs 
             WHERE openai_batch_id IS NULL 
               AND status IN ('processing', 'translating', 'failed')
@@ -44,75 +51,99 @@ def recover_lost_batch_connections():
             logger.info("No orphaned jobs found!")
             return
         
-        # Get list of recent OpenAI batches
+        # Jobs still waiting for a metadata match; a timing match is only a fallback
+        unmatched = {job['id']: job for job in orphaned_jobs}
+        metadata_matches = {}
+        timing_matches = {}
+        # Jobs ordered by creation time, so the timing window is found by bisection
+        jobs_by_created = sorted(
+            ((job['created_at'].replace(tzinfo=None), job['id']) for job in orphaned_jobs)
+        )
+        created_times = [created for created, _ in jobs_by_created]
+        # Batches are listed newest first and are created after their job, so paging can
+        # stop once batches predate every unmatched job by more than the timing window
+        oldest_job_created = created_times[0]
+        
+        # Page through OpenAI batches instead of looking at a fixed recent window
+        scanned = 0
         try:
-            batches_response = client.batches.list(limit=20)  # Recent batches
-            openai_batches = batches_response.data
-            logger.info(f"Found {len(openai_batches)} recent OpenAI batches")
+            for batch in client.batches.list(limit=100):
+                scanned += 1
+                batch_created = datetime.fromtimestamp(batch.created_at)
+                if oldest_job_created - batch_created > TIMING_WINDOW:
+                    break
+                
+                # Check if metadata contains a job ID: look up the ids it mentions
+                metadata = batch.metadata or {}
+                description = metadata.get('description', '')
+                
+                matched = False
+                for job_id in JOB_ID_PATTERN.findall(description):
+                    job_id = job_id.lower()
+                    if job_id in unmatched:
+                        logger.info(f"  FOUND MATCH for job {job_id}: {batch.id} - {description}")
+                        metadata_matches[job_id] = batch
+                        del unmatched[job_id]
+                        matched = True
+                
+                # Also check by timing (within 10 minutes of job creation)
+                if batch.status in ['completed', 'in_progress']:
+                    lo = bisect_left(created_times, batch_created - TIMING_WINDOW)
+                    hi = bisect_right(created_times, batch_created + TIMING_WINDOW)
+                    for job_created, job_id in jobs_by_created[lo:hi]:
+                        if job_id in unmatched and abs(job_created - batch_created) < TIMING_WINDOW:
+                            logger.info(f"  POSSIBLE MATCH by timing for job {job_id}: {batch.id} - {batch_created}")
+                            timing_matches.setdefault(job_id, batch)  # First timing match wins
+                
+                if not unmatched:
+                    break
+                if matched:
+                    oldest_job_created = min(job['created_at'].replace(tzinfo=None) for job in unmatched.values())
         except Exception as e:
             logger.error(f"Failed to list OpenAI batches: {e}")
             return
+        logger.info(f"Scanned {scanned} OpenAI batches")
         
-        # Match batches by metadata and timing
+        # Match batches by metadata, falling back to timing
         recoveries = []
-        
         for job in orphaned_jobs:
             job_id = job['id']
-            job_created = job['created_at']
-            
-            logger.info(f"Searching match for job {job_id} (created: {job_created})")
+            if job_id in metadata_matches:
+                best_match, match_type = metadata_matches[job_id], 'metadata'
+            elif job_id in timing_matches:
+                best_match, match_type = timing_matches[job_id], 'timing'
+            else:
+                continue
             
-            # Find matching OpenAI batch by metadata
-            best_match = None
-            
-            for batch in openai_batches:
-                # Check if metadata contains this job ID
-                metadata = batch.metadata or {}
-                description = metadata.get('description', '')
-                
-                if job_id in description:
-                    logger.info(f"  FOUND MATCH: {batch.id} - {description}")
-                    best_match = batch
-                    break
-                    
-                # Also check by timing (within 10 minutes of job creation)
-                batch_created = datetime.fromtimestamp(batch.created_at)
-                if abs((job_created.replace(tzinfo=None) - batch_created).total_seconds()) < 600:  # 10 minutes
-                    if batch.status in ['completed', 'in_progress']:
-                        logger.info(f"  POSSIBLE MATCH by timing: {batch.id} - {batch_created}")
-                        if not best_match:  # Only use timing match if no metadata match
-                            best_match = batch
-            
-            if best_match:
-                recoveries.append({
-                    'job_id': job_id,
-                    'batch_id': best_match.id,
-                    'batch_status': best_match.status,
-                    'match_type': 'metadata' if job_id in (best_match.metadata or {}).get('description', '') else 'timing'
-                })
+            recoveries.append({
+                'job_id': job_id,
+                'batch_id': best_match.id,
+                'batch_status': best_match.status,
+                'match_type': match_type
+            })
         
         logger.info(f"Found {len(recoveries)} potential recoveries")
         
         # Apply recoveries
         for recovery in recoveries:
-            job_id = recovery['job_id']
-            batch_id = recovery['batch_id'] 
-            batch_status = recovery['batch_status']
-            match_type = recovery['match_type']
-            
-            logger.info(f"Recovering {job_id} -> {batch_id} ({batch_status}) via {match_type}")
-            
-            # Update database
-            cur.execute("""
-                UPDATE batch_jobs 
-                SET 
-                    openai_batch_id = %s,
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE id = %s
-            """, (batch_id, job_id))
-            
-            # If batch is completed, background worker should pick it up automatically
-            
+            logger.info(
+                f"Recovering {recovery['job_id']} -> {recovery['batch_id']} "
+                f"({recovery['batch_status']}) via {recovery['match_type']}"
+            )
+        
+        # Update database in one UPDATE ... FROM (VALUES ...) instead of one round trip per job
+        if recoveries:
+            execute_values(
+                cur,
+                "UPDATE batch_jobs "
+                "SET openai_batch_id = data.batch_id, updated_at = CURRENT_TIMESTAMP "
+                "FROM (VALUES %s) AS data(batch_id, job_id) "
+                "WHERE batch_jobs.id = data.job_id",
+                [(r['batch_id'], r['job_id']) for r in recoveries],
+                template="(%s, %s::uuid)"
+            )
+        
+        # If batch is completed, background worker should pick it up automatically
         conn.commit()
         logger.info(f"Successfully recovered {len(recoveries)} batch connections")
         
@@ -6,51 +6,38 @@ import os
 import sys
 import json
 import hmac
-import hashlib
+import orjson
 import requests
 
+# Одна сессия на процесс: соединение с сервером переиспользуется между запросами
+_SESSION = requests.Session()
+_SESSION.headers.update({'Content-Type': 'application/json'})
+
 def generate_signature(payload: str, shared_key: str) -> str:
     """Генерирует HMAC-SHA256 подпись для payload"""
-    return hmac.new(
+    return hmac.digest(
         shared_key.encode(),
         payload.encode() if isinstance(payload, str) else payload,
-        hashlib.sha256
-    ).hexdigest()
+        'sha256'
+    ).hex()
 
-def test_signature_auth(endpoint: str, payload_data: dict = None):
-    """Тестирует аутентификацию с подписью"""
-    shared_key = os.environ.get("SHARED_KEY")
-    if not shared_key:
-        print("❌ SHARED_KEY не найден в переменных окружения")
-        return False
-    
-    # Подготавливаем payload
-    if payload_data:
-        payload = json.dumps(payload_data, separators=(',', ':'))
-    else:
-        payload = ""
-    
-    # Генерируем подпись
-    signature = generate_signature(payload, shared_key)
-    
+def test_signature_auth(endpoint: str, payload: bytes, signature: str):
+    """Тестирует аутентификацию с подписью (payload уже сериализован и подписан)"""
     # Отправляем запрос
-    headers = {
-        'Content-Type': 'application/json',
-        'X-Signature': signature
-    }
+    headers = {'X-Signature': signature}
     
     print(f"🔑 Генерируем подпись для: {endpoint}")
-    print(f"📝 Payload: {payload}")
+    print(f"📝 Payload: {payload.decode()}")
     print(f"🔐 Подпись: {signature}")
     print(f"📤 Отправляем запрос...")
     
     try:
-        if payload_data:
-            response = requests.post(f"http://localhost:5000{endpoint}", 
-                                   data=payload, headers=headers)
+        if payload:
+            response = _SESSION.post(f"http://localhost:5000{endpoint}", 
+                                     data=payload, headers=headers)
         else:
-            response = requests.get(f"http://localhost:5000{endpoint}", 
-                                  headers=headers)
+            response = _SESSION.get(f"http://localhost:5000{endpoint}", 
+                                    headers=headers)
         
         print(f"📥 Ответ: {response.status_code}")
         if response.text:
@@ -90,8 +77,19 @@ def main():
             print(f"❌ Ошибка загрузки payload: {e}")
             return
     
+    # Сериализуем и подписываем payload один раз: те же байты уходят в запрос и в пример curl.
+    # Сервер проверяет подпись по сырому телу, поэтому подписываем ровно то, что отправляем
+    payload = orjson.dumps(payload_data) if payload_data else b""
+    shared_key = os.environ.get("SHARED_KEY")
+    
     # Тестируем аутентификацию
-    success = test_signature_auth(endpoint, payload_data)
+    if shared_key:
+        signature = generate_signature(payload, shared_key)
+        success = test_signature_auth(endpoint, payload, signature)
+    else:
+        print("❌ SHARED_KEY не найден в переменных окружения")
+        signature = generate_signature(payload, "YOUR_SHARED_KEY")
+        success = False
     
     if success:
         print("\n✅ Аутентификация успешна!")
@@ -99,16 +97,12 @@ def main():
         print("\n❌ Ошибка аутентификации")
     
     print("\n📋 Пример команды curl:")
-    shared_key = os.environ.get("SHARED_KEY", "YOUR_SHARED_KEY")
-    if payload_data:
-        payload_str = json.dumps(payload_data, separators=(',', ':'))
-        signature = generate_signature(payload_str, shared_key)
+    if payload:
         print(f'curl -X POST "http://localhost:5000{endpoint}" \\')
         print(f'  -H "Content-Type: application/json" \\')
         print(f'  -H "X-Signature: {signature}" \\')
-        print(f"  -d '{payload_str}'")
+        print(f"  -d '{payload.decode()}'")
     else:
-        signature = generate_signature("", shared_key)
         print(f'curl -X GET "http://localhost:5000{endpoint}" \\')
         print(f'  -H "X-Signature: {signature}"')
 
@@ -25,7 +25,4 @@ def setup_logging():
     logging.getLogger('requests').setLevel(logging.WARNING)
     logging.getLogger('urllib3').setLevel(logging.WARNING)
     
-    # Enable debug mode
-    logging.basicConfig(level=logging.DEBUG)
-    
     logging.info("Logging configured successfully")
@@ -1,24 +1,34 @@
+import re
 import time
 import random
 import logging
 from functools import wraps
 from typing import Callable, Any
-from config import RETRY_ATTEMPTS, BASE_DELAY_SEC
+import openai
+from config import RETRY_ATTEMPTS, BASE_DELAY_SEC, MAX_DELAY_SEC
 
 logger = logging.getLogger(__name__)
 
-def exponential_backoff(attempt: int, base_delay: int = BASE_DELAY_SEC) -> float:
+# Error codes that retrying cannot fix, matched once per failure without lowercasing
+_NON_RETRYABLE_RE = re.compile(
+    r'invalid_request_error|authentication_error|permission_denied|vision_content_error',
+    re.IGNORECASE
+)
+_CONTEXT_LENGTH_RE = re.compile(r'context_length', re.IGNORECASE)
+
+def exponential_backoff(attempt: int, base_delay: int = BASE_DELAY_SEC,
+                        max_delay: float = MAX_DELAY_SEC) -> float:
     """
-    Calculate exponential backoff delay with jitter
+    Calculate exponential backoff delay with jitter, capped at max_delay before jitter
     """
-    delay = base_delay * (2 ** attempt)
-    # Add 20% jitter
-    jitter = delay * 0.2 * random.random()
-    return delay + jitter
+    delay = min(max_delay, base_delay * (1 << attempt))
+    # Add up to 20% jitter
+    return delay * (1 + 0.2 * random.random())
 
 def retry_with_backoff(max_attempts: int = RETRY_ATTEMPTS, 
                       base_delay: int = BASE_DELAY_SEC,
-                      retryable_exceptions: tuple = (Exception,)):
+                      retryable_exceptions: tuple = (Exception,),
+                      max_delay: float = MAX_DELAY_SEC):
     """
     Decorator for retrying functions with exponential backoff
     """
@@ -33,37 +43,27 @@ def retry_with_backoff(max_attempts: int = RETRY_ATTEMPTS,
                 
                 except retryable_exceptions as e:
                     last_exception = e
-                    error_str = str(e).lower()
+                    error_str = str(e)
                     
                     # Check for non-retryable errors
-                    if any(err in error_str for err in [
-                        'invalid_request_error',
-                        'authentication_error', 
-                        'permission_denied',
-                        'vision_content_error'
-                    ]):
-                        logger.error(f"Non-retryable error in {func.__name__}: {str(e)}")
+                    if _NON_RETRYABLE_RE.search(error_str):
+                        logger.error(f"Non-retryable error in {func.__name__}: {error_str}")
                         raise e
                     
                     # Check for context length errors - special handling
-                    if 'context_length' in error_str:
-                        logger.warning(f"Context length exceeded in {func.__name__}: {str(e)}")
+                    if _CONTEXT_LENGTH_RE.search(error_str):
+                        logger.warning(f"Context length exceeded in {func.__name__}: {error_str}")
                         raise e
                     
-                    # Check for retryable errors (5xx, 429, timeout)
-                    if any(err in error_str for err in [
-                        '5', '429', 'timeout', 'rate_limit', 'server_error'
-                    ]) or attempt < max_attempts - 1:
-                        
-                        if attempt < max_attempts - 1:
-                            delay = exponential_backoff(attempt, base_delay)
-                            logger.warning(f"Attempt {attempt + 1} failed for {func.__name__}: {str(e)}. Retrying in {delay:.2f}s")
-                            time.sleep(delay)
-                        continue
-                    
                     # For other 4xx errors, don't retry
-                    logger.error(f"Non-retryable client error in {func.__name__}: {str(e)}")
-                    raise e
+                    if not is_retryable_error(e):
+                        logger.error(f"Non-retryable client error in {func.__name__}: {error_str}")
+                        raise e
+                    
+                    if attempt < max_attempts - 1:
+                        delay = exponential_backoff(attempt, base_delay, max_delay)
+                        logger.warning(f"Attempt {attempt + 1} failed for {func.__name__}: {error_str}. Retrying in {delay:.2f}s")
+                        time.sleep(delay)
             
             # All attempts failed
             logger.error(f"All {max_attempts} attempts failed for {func.__name__}. Last error: {str(last_exception)}")
@@ -75,6 +75,16 @@ def retry_with_backoff(max_attempts: int = RETRY_ATTEMPTS,
         return wrapper
     return decorator
 
+def is_retryable_error(error: Exception) -> bool:
+    """
+    Decide by exception type: OpenAI status errors retry on 5xx/429/408, connection
+    errors and timeouts always retry; other exceptions (including the client's own
+    incomplete-response errors) keep being retried as before
+    """
+    if isinstance(error, openai.APIStatusError):
+        return should_retry_http_error(error.status_code)
+    return True
+
 def should_retry_http_error(status_code: int) -> bool:
     """
     Determine if HTTP error should be retried